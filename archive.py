@@ -0,0 +1,223 @@
+import json
+import mmap
+import os
+import struct
+import zlib
+from bisect import bisect_left, bisect_right
+from calendar import monthrange
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+from habit import MICROS_PER_DAY, to_micros
+from profiling import span
+
+# Completions from the last HOT_DAYS days stay in the regular event log
+# (completions.jsonl or the completions table) and in memory. Whole months
+# older than that are sealed into one compressed segment file per month,
+# which is only read when a chart or the calendar asks for that month.
+HOT_DAYS = 45
+CACHED_MONTHS = 4
+MAGIC = b"HHS1"
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def day_micros(day):
+    return (day.toordinal() - EPOCH_ORDINAL) * MICROS_PER_DAY
+
+
+class HistoryArchive:
+    # A segment is MAGIC, the header length, a JSON header with the month's
+    # per-day counts and each habit's completed days as a bitmask (bit 0 is
+    # the 1st), then the zlib-compressed events. Segments are never
+    # modified: a late completion for a sealed month replaces the file. Only the headers are
+    # read at startup; events are mapped and inflated on demand.
+    def __init__(self, directory="completions_archive"):
+        self.directory = directory
+        self.months = {}
+        # month -> {name: completed days bitmask}, so streaks over archived
+        # months come from the headers without the events.
+        self.done = {}
+        self.cache = {}
+        self._index()
+
+    def load(self):
+        # Storage calls this under its lock, right before seal(), so a
+        # segment another instance has just written is not missed.
+        self.months, self.done, self.cache = {}, {}, {}
+        if os.path.isdir(self.directory):
+            for filename in sorted(os.listdir(self.directory)):
+                if filename.endswith(".seg"):
+                    year, number = filename[:-4].split("-")
+                    month = (int(year), int(number))
+                    header = self.header(month)
+                    self.months[month] = header['days']
+                    self.done[month] = header['done']
+        self._index()
+        return self
+
+    def _path(self, month):
+        return os.path.join(self.directory, "%04d-%02d.seg" % month)
+
+    def _map(self, month):
+        with open(self._path(month), "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _read(self, data):
+        if data[:4] != MAGIC:
+            raise ValueError(f"not a history segment: {data[:4]!r}")
+        (length,) = struct.unpack_from("<I", data, 4)
+        return json.loads(data[8:8 + length]), 8 + length
+
+    def header(self, month):
+        with self._map(month) as data:
+            return self._read(data)[0]
+
+    def _index(self):
+        # Sorted months and the archived completions before each, so a
+        # cumulative count is a bisect and a partial month sum.
+        self.order = sorted(self.months)
+        self.before = []
+        self.total = 0
+        for month in self.order:
+            self.before.append(self.total)
+            self.total += sum(self.months[month])
+
+    def completed_days(self):
+        # (name, first day of the month, completed days bitmask) for every
+        # habit and archived month.
+        return [(name, date(*month, 1), mask) for month in self.order for name, mask in self.done[month].items()]
+
+    def count_on(self, day):
+        days = self.months.get((day.year, day.month))
+        return days[day.day - 1] if days else 0
+
+    def count_through(self, day):
+        month = (day.year, day.month)
+        i = bisect_right(self.order, month)
+        if not i:
+            return 0
+        if self.order[i - 1] == month:
+            return self.before[i - 1] + sum(self.months[month][:day.day])
+        return self.before[i] if i < len(self.order) else self.total
+
+    def events(self, month):
+        # (sorted micros, names) for a sealed month; the last few months
+        # read stay decoded for repeated calendar clicks.
+        events = self.cache.pop(month, None)
+        if events is None:
+            with self._map(month) as data:
+                offset = self._read(data)[1]
+                with memoryview(data) as view:
+                    payload = json.loads(zlib.decompress(view[offset:]))
+            names, rows = payload['names'], payload['events']
+            micros, running = [], day_micros(date(*month, 1))
+            for delta in rows[1::2]:
+                running += delta
+                micros.append(running)
+            events = (micros, [names[i] for i in rows[0::2]])
+            if len(self.cache) >= CACHED_MONTHS:
+                del self.cache[next(iter(self.cache))]
+        self.cache[month] = events
+        return events
+
+    def habits_on(self, day):
+        month = (day.year, day.month)
+        if not self.count_on(day):
+            return []
+        micros, names = self.events(month)
+        start = day_micros(day)
+        return names[bisect_left(micros, start):bisect_left(micros, start + MICROS_PER_DAY)]
+
+    def seal(self, events, today):
+        # Moves events from months that ended more than HOT_DAYS ago, and
+        # late ones for months already sealed, into segments. Returns the
+        # events that stay hot.
+        cutoff = today - timedelta(days=HOT_DAYS)
+        cutoff = (cutoff.year, cutoff.month)
+        hot, cold = [], defaultdict(Counter)
+        for name, when in events:
+            month = (when.year, when.month)
+            if month < cutoff or month in self.months:
+                cold[month][(to_micros(when), name)] += 1
+            else:
+                hot.append((name, when))
+        if not cold:
+            return events
+        with span("HistoryArchive.seal"):
+            os.makedirs(self.directory, exist_ok=True)
+            for month in sorted(cold):
+                if month in self.months:
+                    # An interrupted seal leaves events in both tiers;
+                    # union (not sum) the copies so none is counted twice.
+                    micros, names = self.events(month)
+                    cold[month] |= Counter(zip(micros, names))
+                self._write(month, sorted(cold[month].elements()))
+            self._index()
+        return hot
+
+    def _write(self, month, events):
+        length = monthrange(*month)[1]
+        days = [0] * length
+        done = defaultdict(int)
+        names = {}
+        rows = []
+        first = last = day_micros(date(*month, 1))
+        for micros, name in events:
+            day = (micros - first) // MICROS_PER_DAY + 1
+            days[day - 1] += 1
+            done[name] |= 1 << (day - 1)
+            # Time deltas instead of timestamps compress to a fraction.
+            rows += [names.setdefault(name, len(names)), micros - last]
+            last = micros
+        payload = zlib.compress(json.dumps({'names': list(names), 'events': rows}, separators=(",", ":")).encode())
+        self._store(month, {'days': days, 'done': dict(done)}, payload)
+
+    def _store(self, month, header, payload):
+        header = json.dumps(header, separators=(",", ":")).encode()
+        filename = self._path(month)
+        with open(filename + ".tmp", "wb") as f:
+            f.write(MAGIC + struct.pack("<I", len(header)) + header + payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(filename + ".tmp", filename)
+        header = json.loads(header)
+        self.months[month] = header['days']
+        self.done[month] = header['done']
+        self.cache.pop(month, None)
+
+
+class TieredLog:
+    # The completion log HabitCore uses when storage has an archive: a
+    # CompletionLog of the hot events in front of the archived months.
+    def __init__(self, archive, hot):
+        self.archive = archive
+        self.hot = hot
+        self.by_habit = hot.by_habit
+        self.sealed_days = archive.completed_days()
+
+    @property
+    def total(self):
+        return self.archive.total + self.hot.total
+
+    def append(self, habit_name, when):
+        self.hot.append(habit_name, when)
+
+    def habits_on(self, day):
+        cold = self.archive.habits_on(day)
+        return cold + self.hot.habits_on(day) if cold else self.hot.habits_on(day)
+
+    def month_counts(self, year, month):
+        counts = self.hot.month_counts(year, month)
+        days = self.archive.months.get((year, month))
+        if days is None:
+            return counts
+        merged = {date(year, month, i + 1): n for i, n in enumerate(days) if n}
+        for day, n in counts.items():
+            merged[day] = merged.get(day, 0) + n
+        return merged
+
+    def counts_for_days(self, days):
+        return [n + self.archive.count_on(day) for n, day in zip(self.hot.counts_for_days(days), days)]
+
+    def cumulative_counts(self, days):
+        return [n + self.archive.count_through(day) for n, day in zip(self.hot.cumulative_counts(days), days)]
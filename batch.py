@@ -0,0 +1,94 @@
+import csv
+import json
+from datetime import datetime
+
+POINTS_PER_COMPLETION = 10
+
+
+def read_batch(path):
+    # CSV needs a header with a habit column and optional category and
+    # completed columns; JSONL uses the same keys. A record with no
+    # completed value only defines the habit. Returns parse_batch() entries.
+    with open(path, "r", newline="") as f:
+        if path.endswith(".csv"):
+            try:
+                records = list(csv.DictReader(f))
+            except csv.Error as e:
+                raise ValueError(f"{path}: {e}") from None
+        else:
+            records = []
+            for number, line in enumerate(f, 1):
+                if line.strip():
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError as e:
+                        raise ValueError(f"{path}, line {number}: {e}") from None
+    return parse_batch(records, path)
+
+
+def parse_time(text):
+    when = datetime.fromisoformat(text)
+    if when.tzinfo is not None:
+        # Everything else keeps naive local times.
+        when = when.astimezone().replace(tzinfo=None)
+    return when
+
+
+def parse_batch(records, source="batch"):
+    # Every record is checked before anything is applied, so a bad one
+    # leaves nothing half imported. Returns (habit, category, completed or
+    # None) per record with a habit; raises ValueError for the first bad one.
+    entries = []
+    for number, record in enumerate(records, 1):
+        try:
+            if not isinstance(record, dict):
+                raise ValueError("not a record")
+            name, category, completed = record.get('habit'), record.get('category'), record.get('completed')
+            if not isinstance(name or "", str) or not isinstance(category or "", str):
+                raise ValueError("habit and category must be text")
+            name = (name or "").strip()
+            if name:
+                entries.append((name, category or "General", parse_time(completed) if completed else None))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"{source}, record {number}: {e}") from None
+    return entries
+
+
+class BatchResult:
+    def __init__(self):
+        self.new_habits = []
+        self.changed_habits = []
+        self.events = []
+
+    @property
+    def points(self):
+        return POINTS_PER_COMPLETION * len(self.events)
+
+    @property
+    def habits_to_save(self):
+        # New habits first and in order, since that is how their rows are appended.
+        new = set(id(h) for h in self.new_habits)
+        return self.new_habits + [h for h in self.changed_habits if id(h) not in new]
+
+
+def apply_batch(habits, entries, log, streaks, make_habit, today):
+    result = BatchResult()
+    index = {habit.name: habit for habit in habits}
+    changed = {}
+    for name, category, when in entries:
+        habit = index.get(name)
+        if habit is None:
+            habit = index[name] = make_habit(name, category)
+            result.new_habits.append(habit)
+        if when:
+            habit.total_completions += 1
+            if habit.last_completed is None or when > habit.last_completed:
+                habit.last_completed = when
+            log.append(name, when)
+            streaks.record(name, when.date())
+            result.events.append((name, when))
+            changed[name] = habit
+    for habit in changed.values():
+        habit.streak = streaks.current(habit.name, today)
+    result.changed_habits = list(changed.values())
+    return result
@@ -0,0 +1,276 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from statistics import median
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Each size runs in its own process so peak RSS belongs to that size alone.
+# Usage:
+#   python benchmark.py run [--sizes 10,1000,100000,1000000] [--out FILE]
+#   python benchmark.py compare OLD.json NEW.json [--threshold PCT]
+
+DEFAULT_SIZES = [10, 1000, 100000, 1000000]
+DEFAULT_OUT = "benchmark_baseline.json"
+CATEGORIES = ["General", "Health", "Productivity", "Learning"]
+
+
+def generate_store(directory, size, journal_entries, completions, seed=1):
+    rng = random.Random(seed)
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    habits = [{
+        'name': f"Habit {i}",
+        'category': CATEGORIES[i % len(CATEGORIES)],
+        'streak': 0,
+        'total_completions': 0,
+        'last_completed': None,
+    } for i in range(size)]
+    with open(os.path.join(directory, "completions.jsonl"), "w") as f:
+        for _ in range(completions):
+            habit = habits[rng.randrange(size)]
+            when = today - timedelta(days=rng.randrange(90), seconds=rng.randrange(86400))
+            habit['total_completions'] += 1
+            if habit['last_completed'] is None or when.isoformat() > habit['last_completed']:
+                habit['last_completed'] = when.isoformat()
+            f.write(json.dumps({'habit': habit['name'], 'at': when.isoformat()}) + "\n")
+    with open(os.path.join(directory, "habits.json"), "w") as f:
+        json.dump(habits, f)
+    with open(os.path.join(directory, "points.json"), "w") as f:
+        json.dump(completions * 10, f)
+    with open(os.path.join(directory, "last_update.json"), "w") as f:
+        json.dump(str(today.date()), f)
+    words = "today I kept going with the plan and felt better than yesterday".split()
+    os.makedirs(os.path.join(directory, "journal"), exist_ok=True)
+    for i in range(journal_entries):
+        when = today - timedelta(minutes=37 * i)
+        with open(os.path.join(directory, "journal", when.strftime("journal_%Y-%m-%d_%H-%M-%S.txt")), "w") as f:
+            f.write(" ".join(rng.choice(words) for _ in range(rng.randrange(20, 400))))
+
+
+def measure(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    # One more run under tracemalloc for the Python-level allocation peak;
+    # it is kept out of the timings because tracing slows everything down.
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'min_ms': round(min(times), 3), 'median_ms': round(median(times), 3), 'peak_kb': peak // 1024}
+
+
+def run_size(size, journal_entries, completions, repeat):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt6.QtWidgets import QApplication
+    from core import HabitCore
+    from journal import open_journal
+    import player
+
+    app = QApplication.instance() or QApplication([])
+    results = {}
+
+    def timed(name, fn, times=repeat):
+        results[name] = measure(fn, times)
+
+    # SQLite stores migrate from the generated JSON the first time they open.
+    HabitCore().close()
+
+    def load_core():
+        HabitCore().close()
+    timed("load_core", load_core)
+
+    core = HabitCore()
+    timed("load_habits", core.load_habits)
+
+    def save_habits():
+        core.save_habits()
+        core.storage.writer.flush()
+    timed("save_habits", save_habits)
+    core.close()
+
+    window = player.HabitTracker()
+    window.show()
+    # The first paint queues build_progress_chart (and the matplotlib
+    # import); let it run, or run it here, before anything is timed.
+    deadline = time.perf_counter() + 1
+    while not hasattr(window, "chart_canvas") and time.perf_counter() < deadline:
+        app.processEvents()
+    if not hasattr(window, "chart_canvas"):
+        window.build_progress_chart()
+    app.processEvents()
+    window.habit_list.setCurrentIndex(window.habit_model.index(size // 2))
+
+    def complete_habit():
+        window.complete_habit()
+        window.core.storage.writer.flush()
+    timed("complete_habit", complete_habit)
+
+    def update_habit_list():
+        window.habit_model.beginResetModel()
+        window.habit_model.endResetModel()
+        app.processEvents()
+    timed("update_habit_list", update_habit_list)
+
+    # Charts may defer drawing to the event loop, so it is drained inside the timing.
+    def update_progress_chart():
+        window.update_progress_chart()
+        app.processEvents()
+    timed("update_progress_chart", update_progress_chart)
+
+    for index in range(window.tabs.count()):
+        if window.tabs.tabText(index) == "Statistics":
+            window.ensure_tab_built(window.tabs.widget(index))
+
+    def update_stats_charts():
+        window.update_stats_charts()
+        app.processEvents()
+    timed("update_stats_charts", update_stats_charts)
+
+    def open_journal_index():
+        open_journal()
+    timed("journal_scan", open_journal_index, 1)
+    timed("journal_reopen", open_journal_index)
+
+    for index in range(window.tabs.count()):
+        if window.tabs.tabText(index) == "Journal":
+            window.ensure_tab_built(window.tabs.widget(index))
+    timed("load_journal_list", window.load_journal_list)
+
+    window.close()
+    app.processEvents()
+    if resource:
+        # ru_maxrss is KiB on Linux and bytes on macOS.
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        results['process'] = {'max_rss_kb': rss // 1024 if sys.platform == "darwin" else rss}
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(args):
+    here = os.path.dirname(os.path.abspath(__file__))
+    report = {
+        'revision': git_revision(),
+        'created': datetime.now().isoformat(timespec="seconds"),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'storage': args.storage,
+        'repeat': args.repeat,
+        'sizes': {},
+    }
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen", PYTHONPATH=here)
+    env.pop("HABIT_HERO_JOURNAL", None)
+    if args.storage == "sqlite":
+        env['HABIT_HERO_STORAGE'] = "sqlite"
+    else:
+        env.pop("HABIT_HERO_STORAGE", None)
+    for size in args.sizes:
+        completions = min(size * args.completions_per_habit, args.max_completions)
+        with tempfile.TemporaryDirectory(prefix="habit-bench-") as directory:
+            generate_store(directory, size, args.journal, completions)
+            print(f"{size} habits, {completions} completions, {args.journal} journal entries...", file=sys.stderr)
+            proc = subprocess.run(
+                [sys.executable, os.path.join(here, "benchmark.py"), "size", str(size), "--journal", str(args.journal),
+                 "--completions", str(completions), "--repeat", str(args.repeat)],
+                cwd=directory, env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(proc.stderr, file=sys.stderr)
+            return proc.returncode
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        result['completions'] = completions
+        result['journal_entries'] = args.journal
+        report['sizes'][str(size)] = result
+        for name, timing in result.items():
+            if isinstance(timing, dict) and 'median_ms' in timing:
+                print(f"  {name:<24}{timing['median_ms']:>12.1f} ms{timing['peak_kb']:>12} KiB", file=sys.stderr)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.out}", file=sys.stderr)
+    return 0
+
+
+def compare(args):
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    print(f"{old.get('revision')} -> {new.get('revision')}")
+    regressions = 0
+    for size, results in new['sizes'].items():
+        before = old['sizes'].get(size)
+        if before is None:
+            continue
+        print(f"\n{size} habits")
+        for name, timing in results.items():
+            if not isinstance(timing, dict) or 'median_ms' not in timing or name not in before:
+                continue
+            was, now = before[name]['median_ms'], timing['median_ms']
+            change = (now - was) / was * 100 if was else 0.0
+            flag = ""
+            if change > args.threshold and now - was > args.min_ms:
+                flag = "  REGRESSION"
+                regressions += 1
+            print(f"  {name:<24}{was:>12.1f}{now:>12.1f} ms {change:>+8.1f}%"
+                  f"{before[name]['peak_kb']:>10}{timing['peak_kb']:>10} KiB{flag}")
+    return 1 if regressions else 0
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Habit Hero benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="generate stores and record a baseline")
+    run_parser.add_argument("--sizes", type=lambda s: [int(x) for x in s.split(",")], default=DEFAULT_SIZES)
+    run_parser.add_argument("--journal", type=int, default=5000, help="journal entries per store")
+    run_parser.add_argument("--completions-per-habit", type=int, default=3)
+    run_parser.add_argument("--max-completions", type=int, default=1000000)
+    run_parser.add_argument("--storage", choices=["json", "sqlite"], default="json")
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.add_argument("--out", default=DEFAULT_OUT)
+
+    compare_parser = commands.add_parser("compare", help="compare two baselines")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=10.0,
+                                help="percent slowdown reported as a regression")
+    compare_parser.add_argument("--min-ms", type=float, default=1.0,
+                                help="ignore slowdowns smaller than this many milliseconds")
+
+    # Internal: benchmark one generated store in the current directory.
+    size_parser = commands.add_parser("size")
+    size_parser.add_argument("size", type=int)
+    size_parser.add_argument("--journal", type=int, default=0)
+    size_parser.add_argument("--completions", type=int, default=0)
+    size_parser.add_argument("--repeat", type=int, default=3)
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        return run(args)
+    if args.command == "compare":
+        return compare(args)
+    print(json.dumps(run_size(args.size, args.journal, args.completions, args.repeat)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,115 @@
+import sys
+import threading
+import traceback
+
+from PyQt6.QtCore import QObject, QSize, pyqtSignal
+from PyQt6.QtGui import QImage, QPixmap
+from PyQt6.QtWidgets import QLabel, QSizePolicy
+
+from charts import ProgressChart, StatsCharts
+
+# Subplot grid and chart class for each chart the render thread can draw.
+CHARTS = {
+    "progress": ((), ProgressChart),
+    "stats": ((2, 2), StatsCharts),
+}
+
+
+class RenderSignals(QObject):
+    rendered = pyqtSignal(str, int, QImage)
+
+
+class ChartRenderThread:
+    # Rasterizes chart data snapshots with Agg on a worker thread. Only the
+    # newest request per chart is kept, so a burst of updates renders once.
+    def __init__(self):
+        self.signals = RenderSignals()
+        self.condition = threading.Condition()
+        self.pending = {}
+        self.latest = {}
+        self.closed = False
+        # Figures belong to the worker thread and are never touched elsewhere.
+        self.figures = {}
+        self.thread = threading.Thread(target=self._run, name="chart-render", daemon=True)
+        self.thread.start()
+
+    def submit(self, key, width, height, dpi, data):
+        with self.condition:
+            seq = self.latest.get(key, 0) + 1
+            self.latest[key] = seq
+            self.pending[key] = (seq, width, height, dpi, data)
+            self.condition.notify_all()
+        return seq
+
+    def is_current(self, key, seq):
+        with self.condition:
+            return self.latest.get(key) == seq
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.pending.clear()
+            self.condition.notify_all()
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                key, (seq, width, height, dpi, data) = self.pending.popitem()
+            try:
+                image = self._render(key, width, height, dpi, data)
+            except Exception:
+                traceback.print_exc(file=sys.stderr)
+                continue
+            if self.is_current(key, seq):
+                self.signals.rendered.emit(key, seq, image)
+
+    def _render(self, key, width, height, dpi, data):
+        entry = self.figures.get(key)
+        if entry is None:
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            grid, chart_class = CHARTS[key]
+            figure = Figure(dpi=dpi)
+            entry = self.figures[key] = (figure, FigureCanvasAgg(figure), chart_class(figure.subplots(*grid)))
+        figure, canvas, chart = entry
+        resized = (round(figure.get_figwidth() * figure.dpi), round(figure.get_figheight() * figure.dpi)) != (width, height)
+        if resized:
+            figure.set_dpi(dpi)
+            figure.set_size_inches(width / dpi, height / dpi)
+        if chart.update(*data) or resized:
+            figure.tight_layout()
+        canvas.draw()
+        # copy() detaches the image from Agg's buffer before the next render.
+        return QImage(canvas.buffer_rgba(), width, height, QImage.Format.Format_RGBA8888).copy()
+
+
+class ChartImage(QLabel):
+    # Shows a chart rendered elsewhere; asks for a new render when resized.
+    resized = pyqtSignal()
+
+    def __init__(self, figsize, dpi=100, parent=None):
+        super().__init__(parent)
+        self.dpi = dpi
+        self.default_size = QSize(int(figsize[0] * dpi), int(figsize[1] * dpi))
+        self.setMinimumSize(200, 150)
+        self.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
+
+    def sizeHint(self):
+        return self.default_size
+
+    def render_size(self):
+        ratio = self.devicePixelRatioF()
+        return max(1, round(self.width() * ratio)), max(1, round(self.height() * ratio)), round(self.dpi * ratio)
+
+    def show_image(self, image):
+        image.setDevicePixelRatio(self.devicePixelRatioF())
+        self.setPixmap(QPixmap.fromImage(image))
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.resized.emit()
@@ -0,0 +1,204 @@
+import math
+
+# Chart objects keep their artists between updates and only touch what
+# changed. update() returns True when ticks, labels or limits moved, which is
+# the only time the figure needs a re-layout and a full redraw.
+
+
+def nice_limit(value):
+    # Smallest 1, 2 or 5 x 10^n at or above value, so an axis only rescales
+    # when the data outgrows it or shrinks well below it.
+    if value <= 5:
+        return 5
+    magnitude = 10 ** math.floor(math.log10(value))
+    for step in (1, 2, 5, 10):
+        if step * magnitude >= value:
+            return step * magnitude
+
+
+def needs_limit(current, value):
+    if current is None or value > current or value <= current / 4:
+        return nice_limit(value * 1.1)
+    return current
+
+
+class ProgressChart:
+    def __init__(self, ax, days=7):
+        self.ax = ax
+        self.bars = ax.bar(range(days), [0] * days)
+        ax.set_xticks(range(days))
+        ax.set_ylabel('Habits Completed')
+        ax.set_title('Habit Completion Progress')
+        self.dates = None
+        self.top = None
+
+    def update(self, dates, counts):
+        changed = False
+        if dates != self.dates:
+            self.dates = list(dates)
+            self.ax.set_xticklabels([date.strftime('%d/%m') for date in dates], rotation=45)
+            changed = True
+        top = needs_limit(self.top, max(counts, default=0))
+        if top != self.top:
+            self.top = top
+            self.ax.set_ylim(0, top)
+            changed = True
+        for bar, count in zip(self.bars, counts):
+            bar.set_height(count)
+        return changed
+
+
+class StatsCharts:
+    def __init__(self, axes, top=5):
+        self.pie_ax, self.streak_ax, self.completion_ax, self.points_ax = axes.flat
+        self.pie_ax.set_title('Habit Completion by Category')
+        self.categories = None
+        self.pie = None
+
+        self.streak_ax.set_title('Top 5 Habits by Streak')
+        self.streak_bars = self.streak_ax.barh(range(top), [0] * top)
+        self.streak_ax.set_yticks(range(top))
+        self.streak_names = None
+        self.streak_limit = None
+
+        self.completion_ax.set_title('Total Completions Over Time')
+        self.points_ax.set_title('Points Balance Over Time')
+        self.lines = {}
+        self.dates = None
+
+    def update(self, category_totals, top_habits, dates, completions, points):
+        changed = self._update_pie(category_totals)
+        changed |= self._update_streaks(top_habits)
+        dates_changed = dates != self.dates
+        self.dates = list(dates)
+        changed |= self._update_line(self.completion_ax, dates, completions, dates_changed)
+        changed |= self._update_line(self.points_ax, dates, points, dates_changed)
+        return changed
+
+    def artists(self):
+        # Everything update() moves without a re-layout, for the Blitter.
+        pie = [artist for group in self.pie for artist in group] if self.pie else []
+        return pie + list(self.streak_bars) + list(self.lines.values())
+
+    def _update_pie(self, totals):
+        names = list(totals)
+        values = list(totals.values())
+        total = sum(values)
+        if names != self.categories or (self.pie is None) != (total == 0):
+            # New categories change the wedge and label set, so rebuild
+            # just this pie. An all-zero pie is left empty.
+            if self.pie:
+                for artist in [a for group in self.pie for a in group]:
+                    artist.remove()
+            self.categories = names
+            self.pie = self.pie_ax.pie(values, labels=names, autopct='%1.1f%%') if total else None
+            return True
+        if self.pie is None:
+            return False
+        theta = 0.0
+        for wedge, label, pct, value in zip(*self.pie, values):
+            fraction = value / total
+            wedge.set_theta1(theta)
+            wedge.set_theta2(theta + 360 * fraction)
+            # Same placement as Axes.pie: labels at 1.1 and percentages at
+            # 0.6 of the radius, on the wedge's middle angle.
+            middle = math.radians(theta + 180 * fraction)
+            x, y = math.cos(middle), math.sin(middle)
+            label.set_position((1.1 * x, 1.1 * y))
+            label.set_horizontalalignment('left' if x > 0 else 'right')
+            pct.set_position((0.6 * x, 0.6 * y))
+            pct.set_text('%1.1f%%' % (100 * fraction))
+            theta += 360 * fraction
+        return False
+
+    def _update_streaks(self, top_habits):
+        changed = False
+        names = [name for name, _ in top_habits]
+        if names != self.streak_names:
+            self.streak_names = names
+            self.streak_ax.set_yticklabels(names + [""] * (len(self.streak_bars) - len(names)))
+            changed = True
+        streaks = [streak for _, streak in top_habits]
+        for i, bar in enumerate(self.streak_bars):
+            bar.set_width(streaks[i] if i < len(streaks) else 0)
+        limit = needs_limit(self.streak_limit, max(streaks, default=0))
+        if limit != self.streak_limit:
+            self.streak_limit = limit
+            self.streak_ax.set_xlim(0, limit)
+            changed = True
+        return changed
+
+    def _update_line(self, ax, dates, values, dates_changed):
+        line = self.lines.get(ax)
+        if line is None:
+            # Plotted once with real dates so the axis picks up date units.
+            line = self.lines[ax] = ax.plot(dates, values)[0]
+        else:
+            line.set_data(dates, values)
+        low, high = ax.get_ylim()
+        if not dates_changed and len(values) and low <= min(values) and max(values) <= high:
+            return False
+        if dates_changed:
+            ax.set_xticks([dates[0], dates[-1]])
+            ax.set_xticklabels([dates[0].strftime('%d/%m'), dates[-1].strftime('%d/%m')])
+        ax.relim()
+        ax.autoscale_view()
+        # Headroom above the data, so the next completions still fit and
+        # only need a blit.
+        low, high = ax.get_ylim()
+        ax.set_ylim(low, high + (high - low) / 4, auto=None)
+        return True
+
+
+class Blitter:
+    # Redraws a few animated artists over cached backgrounds of their axes
+    # instead of re-rendering the whole figure. Each axes is restored and
+    # blitted over its whole subplot cell, so text drawn just outside it,
+    # such as pie labels, is repainted too.
+    def __init__(self, canvas, artists=()):
+        self.canvas = canvas
+        self.groups = {}
+        self.backgrounds = None
+        self.regions = {}
+        self.set_artists(artists)
+        canvas.mpl_connect("draw_event", self.on_draw)
+
+    def set_artists(self, artists):
+        # For after a full redraw that added or replaced artists.
+        self.groups = {}
+        for artist in artists:
+            artist.set_animated(True)
+            self.groups.setdefault(artist.axes, []).append(artist)
+
+    def region(self, ax):
+        # The axes' tile of the figure: its grid cell plus half the gap to
+        # each neighbouring cell, or all of it up to the figure's edge.
+        from matplotlib.transforms import Bbox
+        spec = ax.get_subplotspec()
+        bottoms, tops, lefts, rights = spec.get_gridspec().get_grid_positions(ax.figure)
+        first_row, last_row = spec.rowspan.start, spec.rowspan.stop - 1
+        first_col, last_col = spec.colspan.start, spec.colspan.stop - 1
+        top = 1 if first_row == 0 else (bottoms[first_row - 1] + tops[first_row]) / 2
+        bottom = 0 if last_row == len(tops) - 1 else (bottoms[last_row] + tops[last_row + 1]) / 2
+        left = 0 if first_col == 0 else (rights[first_col - 1] + lefts[first_col]) / 2
+        right = 1 if last_col == len(lefts) - 1 else (rights[last_col] + lefts[last_col + 1]) / 2
+        return Bbox.from_extents(left, bottom, right, top).transformed(ax.figure.transFigure)
+
+    def on_draw(self, event):
+        self.regions = {ax: self.region(ax) for ax in self.groups}
+        self.backgrounds = {ax: self.canvas.copy_from_bbox(self.regions[ax]) for ax in self.groups}
+        for ax in self.groups:
+            self.draw_artists(ax)
+
+    def draw_artists(self, ax):
+        for artist in self.groups[ax]:
+            ax.draw_artist(artist)
+
+    def update(self):
+        if self.backgrounds is None or self.backgrounds.keys() != self.groups.keys():
+            self.canvas.draw_idle()
+            return
+        for ax, background in self.backgrounds.items():
+            self.canvas.restore_region(background)
+            self.draw_artists(ax)
+            self.canvas.blit(self.regions[ax])
@@ -0,0 +1,332 @@
+import sys
+from datetime import datetime, time, timedelta
+
+import profiling
+from archive import TieredLog
+from batch import POINTS_PER_COMPLETION, apply_batch, parse_batch, read_batch
+from habit import Habit, decode_habits
+from history import CompletionLog
+from ledger import PointsLedger
+from storage import first_completion, open_storage
+from streaks import StreakEngine
+
+# Nothing in here may import PyQt6 or matplotlib; numpy is only imported
+# the first time statistics are asked for.
+
+
+class HabitCore:
+    def __init__(self, storage=None):
+        self.storage = storage or open_storage()
+        # Everything is read in one go, so what is loaded belongs together
+        # even while other instances write, and first-run seeding and
+        # archiving happen once.
+        with self.storage.loading():
+            self.habits = self.load_habits()
+            self.index = {habit.name: habit for habit in self.habits}
+            self.completion_log = self.load_completion_log()
+            self.ledger = self.load_ledger()
+            self.rewards = self.load_rewards()
+            self.last_update = self.load_last_update()
+        self.streaks = StreakEngine().load(self.completion_log, self.habits)
+        self._stats = None
+
+    def close(self):
+        self.storage.close()
+
+    # Habits and points
+
+    @property
+    def points(self):
+        return self.ledger.balance
+
+    def adjust_points(self, amount, reason):
+        ledger = self.ledger.record(amount, reason)
+        self.storage.save_points(self.points, ledger)
+
+    def find(self, name):
+        return self.index.get(name)
+
+    def add_habit(self, name, category="General"):
+        if not name or name in self.index:
+            return None
+        habit = Habit(name, category)
+        self.habits.append(habit)
+        self.index[name] = habit
+        if self._stats:
+            self._stats.add(habit)
+        self.save_habits([habit])
+        return habit
+
+    def complete_habit(self, habit, when=None):
+        habit.total_completions += 1
+        habit.last_completed = when or datetime.now()
+        self.completion_log.append(habit.name, habit.last_completed)
+        day = habit.last_completed.date()
+        self.streaks.record(habit.name, day)
+        habit.streak = self.streaks.current(habit.name, day)
+        ledger = self.ledger.record(POINTS_PER_COMPLETION, "habit:" + habit.name)
+        if self._stats:
+            self._stats.update(habit)
+        self.storage.record_completion(habit, self.habits, self.points, ledger)
+        return habit
+
+    def import_records(self, records, today=None):
+        # Raises ValueError, with nothing applied, if any record is bad.
+        return self.import_entries(parse_batch(records), today)
+
+    def import_entries(self, entries, today=None):
+        result = apply_batch(self.habits, entries, self.completion_log, self.streaks,
+                             Habit, today or datetime.now().date())
+        for habit in result.new_habits:
+            self.habits.append(habit)
+            self.index[habit.name] = habit
+        if self._stats:
+            for habit in result.new_habits:
+                self._stats.add(habit)
+            for habit in result.changed_habits:
+                self._stats.update(habit)
+        ledger = self.ledger.record(result.points, "import") if result.points else []
+        self.storage.record_batch(self.habits, result.habits_to_save, result.events, self.points, ledger)
+        return result
+
+    def import_files(self, paths):
+        return self.import_entries([entry for path in paths for entry in read_batch(path)])
+
+    def level_progress(self):
+        return self.points // 100, self.points % 100
+
+    def check_daily_reset(self, today=None):
+        today = today or datetime.now().date()
+        if self.last_update == str(today):
+            return []
+        reset = self.reset_daily_habits(today)
+        self.last_update = str(today)
+        self.save_last_update()
+        return reset
+
+    def reset_daily_habits(self, today):
+        reset = []
+        for name in self.streaks.broken(today):
+            habit = self.index.get(name)
+            if habit and habit.streak:
+                habit.streak = 0
+                if self._stats:
+                    self._stats.update(habit)
+                reset.append(habit)
+        self.save_habits(reset)
+        return reset
+
+    def apply_remote(self, message):
+        # Applies a sync server delta or snapshot; returns the habits that
+        # were added and the ones that changed. Completions the server
+        # echoes back for this client's own ops are already in the log.
+        new, changed = [], []
+        for record in message['habits']:
+            habit = self.index.get(record['name'])
+            if habit is None:
+                habit = decode_habits([record])[0]
+                self.habits.append(habit)
+                self.index[habit.name] = habit
+                if self._stats:
+                    self._stats.add(habit)
+                new.append(habit)
+                continue
+            habit.category = sys.intern(record['category'])
+            habit.streak = record['streak']
+            habit.total_completions = record['total_completions']
+            habit.last_completed = datetime.fromisoformat(record['last_completed']) if record['last_completed'] else None
+            if self._stats:
+                self._stats.update(habit)
+            changed.append(habit)
+        events = [(name, datetime.fromisoformat(at)) for name, at in message['completions']]
+        if message['op'] == "snapshot":
+            self.completion_log = CompletionLog().load(events)
+            self.streaks = StreakEngine().load(self.completion_log)
+        elif not message.get('own'):
+            for name, when in events:
+                self.completion_log.append(name, when)
+                self.streaks.record(name, when.date())
+        if 'rewards' in message:
+            self.rewards = message['rewards']
+        if 'ledger' in message:
+            self.ledger = PointsLedger().load(message['ledger'])
+        if message['points'] != self.points:
+            self.ledger.record(message['points'] - self.points, "sync")
+        # Remote storage sends point changes relative to what the core holds.
+        self.storage.points = self.points
+        return new, changed
+
+    def sync(self, handler):
+        # Takes in what other app instances sharing the store have written.
+        # handler gets the ExternalChanges, or None, on the writer thread;
+        # apply_external() is for the thread that owns the core.
+        self.storage.poll(handler)
+
+    def apply_external(self, changes):
+        # Counts come only from the other instance's completion events, which
+        # are read in full, so nothing is counted twice.
+        new, changed = {}, {}
+        for other in changes.habits:
+            habit = self.index.get(other.name)
+            if habit is None:
+                new[other.name] = self._add_external(other.name, other.category)
+            elif habit.category != other.category:
+                habit.category = sys.intern(other.category)
+                changed[habit.name] = habit
+        for name, when in changes.completions:
+            habit = self.index.get(name)
+            if habit is None:
+                habit = new[name] = self._add_external(name, "General")
+            habit.total_completions += 1
+            if habit.last_completed is None or when > habit.last_completed:
+                habit.last_completed = when
+            self.completion_log.append(name, when)
+            self.streaks.record(name, when.date())
+            changed[name] = habit
+        today = datetime.now().date()
+        for habit in changed.values():
+            habit.streak = self.streaks.current(habit.name, today)
+            if self._stats:
+                self._stats.update(habit)
+        for record in changes.ledger:
+            self.ledger.record(record['amount'], record['reason'], datetime.fromisoformat(record['at']))
+        if changes.rewards is not None:
+            self.rewards = changes.rewards
+        if changes.last_update is not None and changes.last_update > self.last_update:
+            self.last_update = changes.last_update
+        return list(new.values()), [habit for name, habit in changed.items() if name not in new]
+
+    def _add_external(self, name, category):
+        habit = Habit(name, category)
+        self.habits.append(habit)
+        self.index[name] = habit
+        if self._stats:
+            self._stats.add(habit)
+        return habit
+
+    # Rewards
+
+    def claim_reward(self, reward):
+        if self.points < reward['cost']:
+            return False
+        self.adjust_points(-reward['cost'], "reward:" + reward['name'])
+        return True
+
+    def add_reward(self, reward):
+        self.rewards.append(reward)
+        self.save_rewards()
+
+    # Chart data series
+
+    @property
+    def stats(self):
+        if self._stats is None:
+            from stats import StatsEngine
+            self._stats = StatsEngine(self.habits)
+        return self._stats
+
+    def progress_series(self, days=7, today=None):
+        today = today or datetime.now().date()
+        dates = [today - timedelta(days=i) for i in range(days)][::-1]
+        return dates, self.completion_log.counts_for_days(dates)
+
+    def category_totals(self):
+        return self.stats.category_totals()
+
+    def top_streaks(self, k=5):
+        return self.stats.top_streaks(k)
+
+    def completion_series(self, days=30, today=None):
+        today = today or datetime.now().date()
+        return self.stats.cumulative_series(self.completion_log, today - timedelta(days=days - 1), days)
+
+    def points_series(self, days=30, today=None):
+        # Balance at the end of each day, read from the ledger's snapshots.
+        today = today or datetime.now().date()
+        dates = [today - timedelta(days=i) for i in range(days)][::-1]
+        return dates, [self.ledger.balance_at(datetime.combine(day, time.max)) for day in dates]
+
+    def month_counts(self, year, month):
+        return self.completion_log.month_counts(year, month)
+
+    def habits_on(self, day):
+        return self.completion_log.habits_on(day)
+
+    # Persistence
+
+    def load_habits(self):
+        return decode_habits(self.storage.load_habits())
+
+    def save_habits(self, changed=None):
+        self.storage.save_habits(self.habits, changed)
+
+    def load_completion_log(self):
+        # The seed starts the log on the first run with one; storage with
+        # an archive returns only the events that stay hot.
+        seed = [(h.name, h.last_completed) for h in self.habits if h.last_completed]
+        log = CompletionLog().load(self.storage.load_completions(seed))
+        archive = self.storage.archive
+        return log if archive is None else TieredLog(archive, log)
+
+    def load_ledger(self):
+        records = self.storage.load_ledger()
+        if records is not None:
+            return PointsLedger().load(records)
+        # Storage without a ledger (an older sync server) only keeps the
+        # balance; this ledger opens with it, dated before the first
+        # completion, and lasts the session.
+        ledger = PointsLedger()
+        points = self.storage.load_points()
+        if points:
+            events = ((name, when) for name, whens in self.completion_log.by_habit.items() for when in whens)
+            ledger.record(points, "opening", first_completion(events, self.storage.archive))
+        return ledger
+
+    def load_rewards(self):
+        return self.storage.load_rewards()
+
+    def save_rewards(self):
+        self.storage.save_rewards(self.rewards)
+
+    def load_last_update(self):
+        return self.storage.load_last_update()
+
+    def save_last_update(self):
+        self.storage.save_last_update(self.last_update)
+
+
+profiling.instrument(HabitCore, handlers=("add_habit", "complete_habit", "import_entries", "reset_daily_habits"))
+
+
+def verify_ledger():
+    core = HabitCore()
+    problems = core.ledger.verify()
+    core.close()
+    for count, stored, rebuilt in problems:
+        print(f"after {count} transactions: stored balance {stored}, rebuilt {rebuilt}")
+    print(f"{len(core.ledger)} transactions, balance {core.points}: "
+          + (f"{len(problems)} mismatches" if problems else "ok"))
+    return 1 if problems else 0
+
+
+def import_files(paths):
+    core = HabitCore()
+    try:
+        result = core.import_files(paths)
+    except (OSError, ValueError) as e:
+        print(f"Import failed, nothing was imported: {e}", file=sys.stderr)
+        return 1
+    finally:
+        core.close()
+    print(f"Imported {len(result.new_habits)} new habits and {len(result.events)} completions (+{result.points} points)")
+    return 0
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["verify-ledger"]:
+        sys.exit(verify_ledger())
+    if sys.argv[1:2] != ["import"] or len(sys.argv) < 3:
+        print("usage: python core.py import FILE.csv|FILE.jsonl [...]\n"
+              "       python core.py verify-ledger", file=sys.stderr)
+        sys.exit(2)
+    sys.exit(import_files(sys.argv[2:]))
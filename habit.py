@@ -0,0 +1,144 @@
+import gc
+import json
+import re
+import sys
+from datetime import datetime, timedelta
+from json.encoder import encode_basestring_ascii
+
+EPOCH = datetime(1970, 1, 1)
+ONE_MICROSECOND = timedelta(microseconds=1)
+MICROS_PER_DAY = 86400 * 10 ** 6
+
+
+def to_micros(when):
+    return (when - EPOCH) // ONE_MICROSECOND
+
+
+def from_micros(micros):
+    return EPOCH + timedelta(microseconds=micros)
+
+
+class Habit:
+    # Slots instead of a __dict__; the last completion is kept as
+    # microseconds since the epoch (local time, like the datetimes it
+    # replaces), so its epoch day is an integer division away.
+    __slots__ = ("name", "category", "streak", "total_completions", "last_micros")
+
+    def __init__(self, name, category="General", streak=0, total_completions=0, last_completed=None):
+        self.name = name
+        self.category = sys.intern(category)
+        self.streak = streak
+        self.total_completions = total_completions
+        self.last_micros = to_micros(datetime.fromisoformat(last_completed)) if last_completed else None
+
+    @property
+    def last_completed(self):
+        return from_micros(self.last_micros) if self.last_micros is not None else None
+
+    @last_completed.setter
+    def last_completed(self, when):
+        self.last_micros = to_micros(when) if when is not None else None
+
+    @property
+    def last_day(self):
+        return self.last_micros // MICROS_PER_DAY if self.last_micros is not None else None
+
+
+def encode_habit(habit):
+    return {
+        'name': habit.name,
+        'category': habit.category,
+        'streak': habit.streak,
+        'total_completions': habit.total_completions,
+        'last_completed': habit.last_completed.isoformat() if habit.last_micros is not None else None
+    }
+
+
+def decode_habits(records):
+    habits = []
+    for item in records:
+        if isinstance(item, Habit):
+            habits.append(item)
+        elif isinstance(item, str):
+            habits.append(Habit(name=item))
+        elif isinstance(item, dict):
+            habits.append(Habit(
+                name=item['name'],
+                category=item.get('category', 'General'),
+                streak=item.get('streak', 0),
+                total_completions=item.get('total_completions', 0),
+                last_completed=item.get('last_completed')
+            ))
+    return habits
+
+
+# habits.json as json.dump writes it for encode_habit() records. The fast
+# path below reads and writes exactly this shape and anything else goes
+# through the json module.
+RECORD = re.compile(
+    r'\{"name": "([^"\\]*(?:\\.[^"\\]*)*)", "category": "([^"\\]*(?:\\.[^"\\]*)*)", "streak": (-?\d+), '
+    r'"total_completions": (-?\d+), "last_completed": (?:null|"([^"\\]*)")\}')
+RECORD_START = '{"name": '
+
+
+def _string(body):
+    return json.loads('"' + body + '"') if "\\" in body else body
+
+
+def parse_habits(text):
+    # Returns Habit objects, or None when the text is not in the canonical
+    # layout and needs json.loads instead. Quotes inside strings are escaped,
+    # so RECORD_START and "}, {" only occur between objects: if every
+    # object matched and objects only follow objects, every habit was read.
+    rows = RECORD.findall(text)
+    if len(rows) != text.count(RECORD_START) or text.count("}, {") != len(rows) - 1 \
+            or not text.rstrip().endswith("}]"):
+        return None
+    habits = []
+    categories = {}
+    new = Habit.__new__
+    fromisoformat = datetime.fromisoformat
+    for name, category, streak, total, last in rows:
+        habit = new(Habit)
+        habit.name = _string(name)
+        interned = categories.get(category)
+        if interned is None:
+            interned = categories[category] = sys.intern(_string(category))
+        habit.category = interned
+        habit.streak = int(streak)
+        habit.total_completions = int(total)
+        habit.last_micros = (fromisoformat(last) - EPOCH) // ONE_MICROSECOND if last else None
+        habits.append(habit)
+    return habits
+
+
+def load_habits_text(text):
+    # Millions of new objects would otherwise trigger repeated full
+    # collections while nothing can be garbage yet.
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        habits = parse_habits(text) if text.lstrip().startswith("[" + RECORD_START) else None
+        return habits if habits is not None else decode_habits(json.loads(text))
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def habit_rows(habits):
+    # A cheap snapshot of the fields to write, taken on the caller's thread.
+    return [(h.name, h.category, h.streak, h.total_completions, h.last_micros) for h in habits]
+
+
+def dump_habits(rows):
+    # Byte-for-byte what json.dump produces for the encode_habit() records.
+    quoted = {}
+    parts = []
+    for name, category, streak, total, last in rows:
+        category_json = quoted.get(category)
+        if category_json is None:
+            category_json = quoted[category] = encode_basestring_ascii(category)
+        last_json = '"' + from_micros(last).isoformat() + '"' if last is not None else "null"
+        parts.append(f'{{"name": {encode_basestring_ascii(name)}, "category": {category_json}, "streak": {streak}, '
+                     f'"total_completions": {total}, "last_completed": {last_json}}}')
+    return "[" + ", ".join(parts) + "]"
@@ -0,0 +1,75 @@
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex
+
+
+class HabitListModel(QAbstractListModel):
+    HabitRole = Qt.ItemDataRole.UserRole + 1
+    NameRole = Qt.ItemDataRole.UserRole + 2
+
+    def __init__(self, habits, parent=None):
+        super().__init__(parent)
+        # Shares the core's habit list. The core appends to it, so the model
+        # only exposes the rows it has been told about through habits_appended.
+        self.habits = habits
+        self.count = len(habits)
+        self.rows = {habit.name: row for row, habit in enumerate(habits)}
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.count
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        habit = self.habits[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return f"🏆 {habit.name} ({habit.category}): {habit.streak} day streak"
+        if role == self.HabitRole:
+            return habit
+        if role == self.NameRole:
+            return habit.name
+        return None
+
+    def find(self, name):
+        row = self.rows.get(name)
+        return self.habits[row] if row is not None else None
+
+    def habits_appended(self, habits):
+        if not habits:
+            return
+        first = self.count
+        self.beginInsertRows(QModelIndex(), first, first + len(habits) - 1)
+        for row, habit in enumerate(habits, first):
+            self.rows[habit.name] = row
+        self.count += len(habits)
+        self.endInsertRows()
+
+    def habit_changed(self, habit):
+        index = self.index(self.rows[habit.name])
+        self.dataChanged.emit(index, index, [Qt.ItemDataRole.DisplayRole])
+
+
+class DayHabitsModel(QAbstractListModel):
+    def __init__(self, habit_model, parent=None):
+        super().__init__(parent)
+        self.habit_model = habit_model
+        self.habits = habit_model.habits
+        self.completed = frozenset()
+        habit_model.rowsInserted.connect(self.reset)
+
+    def set_completed(self, names):
+        # Rows are only formatted when painted, so switching days costs a
+        # set lookup per visible row rather than a pass over every habit.
+        self.completed = frozenset(names)
+        self.reset()
+
+    def reset(self, *args):
+        self.beginResetModel()
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.habit_model.count
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+        habit = self.habits[index.row()]
+        return f"✅ {habit.name}" if habit.name in self.completed else f"❌ {habit.name}"
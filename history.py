@@ -0,0 +1,84 @@
+import calendar
+from bisect import bisect_right, insort
+from collections import defaultdict
+from datetime import date
+
+
+class CompletionLog:
+    def __init__(self):
+        self.by_day = defaultdict(list)
+        self.by_habit = defaultdict(list)
+        self.total = 0
+        # Sorted days that have completions and the running total up to each,
+        # so "completions on or before day X" is a bisect instead of a scan.
+        self._days = []
+        self._cumulative = []
+        self._cumulative_dirty = False
+        # (year, month) -> {day: completions}, filled in when a month is first
+        # asked for and kept current by append().
+        self._month_counts = {}
+        # (name, first day of the month, completed days bitmask) for months
+        # older than the events held here; set by archive.TieredLog.
+        self.sealed_days = []
+
+    def load(self, events):
+        for habit_name, when in events:
+            self.append(habit_name, when)
+        return self
+
+    def append(self, habit_name, when):
+        day = when.date()
+        if day not in self.by_day:
+            if self._days and day < self._days[-1]:
+                insort(self._days, day)
+                self._cumulative_dirty = True
+            else:
+                self._days.append(day)
+                self._cumulative.append(self.total)
+        elif day != self._days[-1]:
+            self._cumulative_dirty = True
+        self.by_day[day].append(habit_name)
+        self.by_habit[habit_name].append(when)
+        self.total += 1
+        if not self._cumulative_dirty:
+            self._cumulative[-1] = self.total
+        month = self._month_counts.get((day.year, day.month))
+        if month is not None:
+            month[day] = month.get(day, 0) + 1
+
+    def _rebuild_cumulative(self):
+        running = 0
+        self._cumulative = []
+        for day in self._days:
+            running += len(self.by_day[day])
+            self._cumulative.append(running)
+        self._cumulative_dirty = False
+
+    def habits_on(self, day):
+        return self.by_day.get(day, [])
+
+    def completions_of(self, habit_name):
+        return self.by_habit.get(habit_name, [])
+
+    def month_counts(self, year, month):
+        counts = self._month_counts.get((year, month))
+        if counts is None:
+            counts = {}
+            for day_number in range(1, calendar.monthrange(year, month)[1] + 1):
+                day = date(year, month, day_number)
+                if day in self.by_day:
+                    counts[day] = len(self.by_day[day])
+            self._month_counts[(year, month)] = counts
+        return counts
+
+    def counts_for_days(self, days):
+        return [len(self.by_day.get(day, ())) for day in days]
+
+    def cumulative_counts(self, days):
+        if self._cumulative_dirty:
+            self._rebuild_cumulative()
+        counts = []
+        for day in days:
+            i = bisect_right(self._days, day)
+            counts.append(self._cumulative[i - 1] if i else 0)
+        return counts
@@ -0,0 +1,282 @@
+import json
+import locale
+import os
+import sys
+import threading
+from bisect import insort
+from collections import defaultdict
+
+from storage import write_json_atomic
+
+PREVIEW_CHARS = 200
+CHUNK_SIZE = 256 * 1024
+# Same encoding the journal files have always been written with.
+ENCODING = locale.getpreferredencoding(False)
+
+
+def is_journal_file(filename):
+    return filename.startswith("journal_") and filename.endswith(".txt")
+
+
+def make_preview(content):
+    return content[:PREVIEW_CHARS] + "..." if len(content) > PREVIEW_CHARS else content
+
+
+def read_preview(path):
+    # A file that is not valid in ENCODING still gets an entry; only its
+    # preview shows replacement characters.
+    with open(path, "r", encoding=ENCODING, errors="replace") as f:
+        return make_preview(f.read(PREVIEW_CHARS + 1))
+
+
+def open_journal(writer=None):
+    # The packed store is opt-in; once journal_segments/ exists it is used.
+    if os.environ.get("HABIT_HERO_JOURNAL") == "packed" or os.path.isdir(PackedJournalStore.DIRECTORY):
+        return PackedJournalStore().load()
+    return JournalIndex(writer=writer).load()
+
+
+class JournalEntry:
+    def __init__(self, filename, size, mtime, preview, path=None, offset=0):
+        # filename is the entry's logical name, journal_<key>.txt; its bytes
+        # live at path[offset:offset + size], which is the file itself unless
+        # the entry was packed into a segment.
+        self.filename = filename
+        self.size = size
+        self.mtime = mtime
+        self.preview = preview
+        self.path = path or filename
+        self.offset = offset
+
+    @property
+    def key(self):
+        return self.filename[8:-4]
+
+    @property
+    def date(self):
+        return self.key[:10]
+
+    @property
+    def label(self):
+        return self.key.replace("_", " ")
+
+    def read_bytes(self):
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            return f.read(self.size)
+
+    def read(self):
+        return self.read_bytes().decode(ENCODING)
+
+
+class JournalCatalog:
+    def __init__(self):
+        self.entries = {}
+        self.by_date = defaultdict(list)
+
+    def _add(self, entry):
+        if entry.filename not in self.entries:
+            insort(self.by_date[entry.date], entry.filename)
+        self.entries[entry.filename] = entry
+
+    def _remove(self, filename):
+        entry = self.entries.pop(filename)
+        self.by_date[entry.date].remove(filename)
+        if not self.by_date[entry.date]:
+            del self.by_date[entry.date]
+
+    def entries_on(self, date_str):
+        return [self.entries[filename] for filename in self.by_date.get(date_str, ())]
+
+    def all_entries(self):
+        return sorted(self.entries.values(), key=lambda e: e.filename, reverse=True)
+
+    def add_entry(self, entry):
+        self._add(entry)
+
+
+class JournalIndex(JournalCatalog):
+    # Entries live in their own directory, so the watcher on it only wakes
+    # for journal files and not for every habits.json or points.json write.
+    # The index itself stays outside it for the same reason.
+    DIRECTORY = "journal"
+
+    def __init__(self, directory=DIRECTORY, path="journal_index.json", writer=None):
+        super().__init__()
+        self.directory = directory
+        self.path = path
+        self.writer = writer
+
+    def load(self):
+        if not os.path.isdir(self.directory):
+            self._adopt_loose_files()
+        try:
+            with open(self.path, "r") as f:
+                for filename, (size, mtime, preview) in json.load(f).items():
+                    self._add(self._entry(filename, size, mtime, preview))
+        except FileNotFoundError:
+            pass
+        # One reconciling pass at startup; after that the watcher drives sync().
+        self.sync()
+        return self
+
+    def _adopt_loose_files(self):
+        # Journals used to sit in the data directory itself. Moving keeps
+        # each file's mtime, so the saved index stays valid.
+        os.makedirs(self.directory)
+        for name in os.listdir("."):
+            if is_journal_file(name):
+                os.replace(name, os.path.join(self.directory, name))
+
+    def save(self):
+        data = {e.filename: [e.size, e.mtime, e.preview] for e in self.entries.values()}
+        if self.writer:
+            self.writer.submit(self.path, lambda: write_json_atomic(self.path, data))
+        else:
+            write_json_atomic(self.path, data)
+
+    def watch_paths(self):
+        return [os.path.abspath(self.directory)]
+
+    def _entry(self, filename, size, mtime, preview):
+        return JournalEntry(filename, size, mtime, preview, os.path.join(self.directory, filename))
+
+    def _refresh(self, filename, stat):
+        entry = self.entries.get(filename)
+        if entry and entry.size == stat.st_size and entry.mtime == stat.st_mtime:
+            return False
+        preview = read_preview(os.path.join(self.directory, filename))
+        self._add(self._entry(filename, stat.st_size, stat.st_mtime, preview))
+        return True
+
+    def sync(self):
+        changed = False
+        seen = set()
+        with os.scandir(self.directory) as it:
+            for dir_entry in it:
+                if is_journal_file(dir_entry.name) and dir_entry.is_file():
+                    seen.add(dir_entry.name)
+                    changed |= self._refresh(dir_entry.name, dir_entry.stat())
+        for filename in set(self.entries) - seen:
+            self._remove(filename)
+            changed = True
+        if changed:
+            self.save()
+        return changed
+
+    def add_entry(self, entry):
+        super().add_entry(entry)
+        self.save()
+
+    def write_entry(self, filename, text, report=None, is_cancelled=lambda: False):
+        # Runs on a worker thread; the caller adds the result with add_entry.
+        data = text.encode(ENCODING)
+        path = os.path.join(self.directory, filename)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            for start in range(0, len(data), CHUNK_SIZE):
+                if is_cancelled():
+                    break
+                f.write(data[start:start + CHUNK_SIZE])
+                if report:
+                    report(min(start + CHUNK_SIZE, len(data)), len(data))
+            f.flush()
+            os.fsync(f.fileno())
+        if is_cancelled():
+            os.remove(tmp_path)
+            return None
+        os.replace(tmp_path, path)
+        return self._entry(filename, len(data), os.stat(path).st_mtime, make_preview(text))
+
+
+class PackedJournalStore(JournalCatalog):
+    # One append-only segment per month, journal_YYYY-MM.seg, with a JSON
+    # lines offset index, journal_YYYY-MM.idx, next to it.
+    DIRECTORY = "journal_segments"
+
+    def __init__(self, directory=DIRECTORY):
+        super().__init__()
+        self.directory = directory
+        self.lock = threading.Lock()
+        # How far into each .idx file has been read, keyed by month.
+        self.index_read = {}
+
+    def _month_path(self, month, extension):
+        return os.path.join(self.directory, f"journal_{month}.{extension}")
+
+    def load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.sync()
+        return self
+
+    def watch_paths(self):
+        return [os.path.abspath(self.directory)] + [os.path.abspath(self._month_path(month, "idx"))
+                                                    for month in self.index_read]
+
+    def sync(self):
+        changed = False
+        for name in os.listdir(self.directory):
+            if name.startswith("journal_") and name.endswith(".idx"):
+                changed |= self._read_index(name[8:-4])
+        return changed
+
+    def _read_index(self, month):
+        # Only the lines appended since the last read are parsed.
+        position = self.index_read.get(month, 0)
+        segment_path = self._month_path(month, "seg")
+        with open(self._month_path(month, "idx"), "rb") as f:
+            f.seek(position)
+            data = f.read()
+        complete = data[:data.rfind(b"\n") + 1]
+        for line in complete.splitlines():
+            record = json.loads(line)
+            self._add(JournalEntry(record['name'], record['size'], record['mtime'], record['preview'],
+                                   segment_path, record['offset']))
+        self.index_read[month] = position + len(complete)
+        return bool(complete)
+
+    def write_entry(self, filename, text, report=None, is_cancelled=lambda: False):
+        # Runs on a worker thread; the caller adds the result with add_entry.
+        data = text.encode(ENCODING)
+        month = filename[8:15]
+        segment_path = self._month_path(month, "seg")
+        with self.lock:
+            with open(segment_path, "ab") as f:
+                offset = f.tell()
+                for start in range(0, len(data), CHUNK_SIZE):
+                    if is_cancelled():
+                        f.truncate(offset)
+                        return None
+                    f.write(data[start:start + CHUNK_SIZE])
+                    if report:
+                        report(min(start + CHUNK_SIZE, len(data)), len(data))
+                f.flush()
+                os.fsync(f.fileno())
+                mtime = os.fstat(f.fileno()).st_mtime
+            entry = JournalEntry(filename, len(data), mtime, make_preview(text), segment_path, offset)
+            with open(self._month_path(month, "idx"), "a") as f:
+                f.write(json.dumps({'name': filename, 'offset': offset, 'size': len(data),
+                                    'mtime': mtime, 'preview': entry.preview}) + "\n")
+        return entry
+
+    def migrate_from(self, index, delete=False):
+        migrated = 0
+        for entry in sorted(index.entries.values(), key=lambda e: e.filename):
+            packed = self.entries.get(entry.filename)
+            # An entry packed by an earlier run is only packed again if the
+            # original has changed since; either way it can be deleted now.
+            if packed is None or packed.read_bytes() != entry.read_bytes():
+                self.add_entry(self.write_entry(entry.filename, entry.read()))
+                migrated += 1
+            if delete:
+                os.remove(entry.path)
+        return migrated
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] != ["migrate"]:
+        print("usage: python journal.py migrate [--delete]", file=sys.stderr)
+        sys.exit(2)
+    store = PackedJournalStore().load()
+    count = store.migrate_from(JournalIndex().load(), delete="--delete" in sys.argv)
+    print(f"Packed {count} journal entries into {store.directory}/")
@@ -0,0 +1,188 @@
+import html
+import json
+import math
+import os
+import re
+import sqlite3
+from collections import Counter, defaultdict
+
+from journal import ENCODING
+
+TOKEN_RE = re.compile(r"\w+")
+SNIPPET_BEFORE = 60
+SNIPPET_BYTES = 200
+
+
+def tokenize(text):
+    # Yields (token, byte offset) so snippets can seek straight to a hit.
+    offset = 0
+    last_end = 0
+    for match in TOKEN_RE.finditer(text):
+        offset += len(text[last_end:match.start()].encode(ENCODING))
+        yield match.group().lower(), offset
+        offset += len(match.group().encode(ENCODING))
+        last_end = match.end()
+
+
+class SearchResult:
+    def __init__(self, filename, score, snippet):
+        self.filename = filename
+        self.score = score
+        self.snippet = snippet
+
+    @property
+    def label(self):
+        return self.filename[8:-4].replace("_", " ")
+
+
+class JournalSearchIndex:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS docs (
+            filename TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            length INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS postings (
+            token TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            tf INTEGER NOT NULL,
+            positions TEXT NOT NULL,
+            PRIMARY KEY (token, filename)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS postings_filename ON postings (filename);
+    """
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, catalog, directory=".", path="journal_search.db", writer=None):
+        # catalog is the JournalIndex or PackedJournalStore the entries live in.
+        self.catalog = catalog
+        self.path = os.path.join(directory, path)
+        self.writer = writer
+        self.conn = sqlite3.connect(self.path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(self.SCHEMA)
+        # Index updates go through the writer thread on their own connection.
+        self.write_conn = None
+
+    def _submit(self, key, work):
+        if self.writer:
+            self.writer.submit(key, work)
+        else:
+            work()
+
+    def _writable(self):
+        if self.write_conn is None:
+            self.write_conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            self.write_conn.execute("PRAGMA synchronous=NORMAL")
+        return self.write_conn
+
+    def _index(self, conn, entry):
+        filename = entry.filename
+        positions = defaultdict(list)
+        for token, offset in tokenize(entry.read()):
+            positions[token].append(offset)
+        conn.execute("DELETE FROM postings WHERE filename = ?", (filename,))
+        conn.executemany("INSERT INTO postings (token, filename, tf, positions) VALUES (?, ?, ?, ?)",
+                         [(token, filename, len(offsets), json.dumps(offsets)) for token, offsets in positions.items()])
+        conn.execute("INSERT OR REPLACE INTO docs (filename, size, mtime, length) VALUES (?, ?, ?, ?)",
+                     (filename, entry.size, entry.mtime, sum(len(offsets) for offsets in positions.values())))
+
+    def _remove(self, conn, filename):
+        conn.execute("DELETE FROM postings WHERE filename = ?", (filename,))
+        conn.execute("DELETE FROM docs WHERE filename = ?", (filename,))
+
+    def update_entry(self, entry, done=None):
+        def work():
+            conn = self._writable()
+            with conn:
+                conn.execute("BEGIN")
+                self._index(conn, entry)
+            if done:
+                done()
+
+        self._submit(("search", entry.filename), work)
+
+    def sync(self, entries, done=None):
+        # Brings the index in line with a JournalIndex, touching only entries
+        # whose size or mtime changed since they were last indexed. With a
+        # writer that happens later: done() is called, on the writer thread,
+        # once the changes are committed. Returns whether there were any.
+        known = {filename: (size, mtime) for filename, size, mtime in
+                 self.conn.execute("SELECT filename, size, mtime FROM docs")}
+        stale = [e for e in entries if known.pop(e.filename, None) != (e.size, e.mtime)]
+        removed = list(known)
+        if not stale and not removed:
+            return False
+
+        def work():
+            conn = self._writable()
+            with conn:
+                conn.execute("BEGIN")
+                for filename in removed:
+                    self._remove(conn, filename)
+                for entry in stale:
+                    try:
+                        self._index(conn, entry)
+                    except FileNotFoundError:
+                        self._remove(conn, entry.filename)
+            if done:
+                done()
+
+        self._submit(None, work)
+        return True
+
+    def search(self, query, limit=20):
+        terms = list(dict.fromkeys(token for token, _ in tokenize(query)))
+        if not terms:
+            return []
+        doc_count, total_length = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs").fetchone()
+        if not doc_count:
+            return []
+        average_length = total_length / doc_count or 1
+
+        # BM25 over the postings of each query term.
+        scores = Counter()
+        first_positions = {}
+        for term in terms:
+            postings = self.conn.execute("""
+                SELECT p.filename, p.tf, p.positions, d.length
+                FROM postings p JOIN docs d ON d.filename = p.filename
+                WHERE p.token = ?
+            """, (term,)).fetchall()
+            idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for filename, tf, positions, length in postings:
+                norm = tf + self.K1 * (1 - self.B + self.B * length / average_length)
+                scores[filename] += idf * tf * (self.K1 + 1) / norm
+                first_positions.setdefault(filename, positions)
+
+        results = []
+        for filename, score in scores.most_common(limit):
+            entry = self.catalog.entries.get(filename)
+            if entry:
+                snippet = self.snippet(entry, json.loads(first_positions[filename])[0], terms)
+                results.append(SearchResult(filename, score, snippet))
+        return results
+
+    def snippet(self, entry, offset, terms):
+        start = max(0, offset - SNIPPET_BEFORE)
+        length = min(SNIPPET_BYTES, entry.size - start)
+        try:
+            with open(entry.path, "rb") as f:
+                f.seek(entry.offset + start)
+                data = f.read(length)
+        except FileNotFoundError:
+            return ""
+        text = data.decode(ENCODING, errors="ignore")
+        pattern = re.compile(r"\b(" + "|".join(re.escape(t) for t in terms) + r")\b", re.IGNORECASE)
+        parts = []
+        last_end = 0
+        for match in pattern.finditer(text):
+            parts.append(html.escape(text[last_end:match.start()]))
+            parts.append(f"<b>{html.escape(match.group())}</b>")
+            last_end = match.end()
+        parts.append(html.escape(text[last_end:]))
+        prefix = "..." if start else ""
+        suffix = "..." if start + len(data) < entry.size else ""
+        return prefix + "".join(parts).replace("\n", " ") + suffix
@@ -0,0 +1,76 @@
+import codecs
+import threading
+
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
+
+from journal import CHUNK_SIZE, ENCODING
+
+
+class JournalTaskSignals(QObject):
+    progress = pyqtSignal(int)
+    finished = pyqtSignal(str, object)
+    failed = pyqtSignal(str, str)
+    cancelled = pyqtSignal(str)
+
+
+class JournalTask(QRunnable):
+    def __init__(self, filename):
+        super().__init__()
+        self.filename = filename
+        self.signals = JournalTaskSignals()
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def is_cancelled(self):
+        return self._cancel.is_set()
+
+    def run(self):
+        try:
+            result = self.work()
+        except (OSError, ValueError) as e:
+            # ValueError covers a file that is not valid in ENCODING; nothing
+            # may escape run() on a pool thread.
+            self.signals.failed.emit(self.filename, str(e))
+            return
+        if self.is_cancelled:
+            self.signals.cancelled.emit(self.filename)
+        else:
+            self.signals.finished.emit(self.filename, result)
+
+    def _report(self, done, total):
+        self.signals.progress.emit(100 if not total else done * 100 // total)
+
+
+class LoadJournalTask(JournalTask):
+    def __init__(self, entry):
+        super().__init__(entry.filename)
+        self.entry = entry
+
+    def work(self):
+        decoder = codecs.getincrementaldecoder(ENCODING)()
+        parts = []
+        with open(self.entry.path, "rb") as f:
+            f.seek(self.entry.offset)
+            done = 0
+            while done < self.entry.size and not self.is_cancelled:
+                chunk = f.read(min(CHUNK_SIZE, self.entry.size - done))
+                if not chunk:
+                    break
+                parts.append(decoder.decode(chunk))
+                done += len(chunk)
+                self._report(done, self.entry.size)
+        parts.append(decoder.decode(b"", final=True))
+        return "".join(parts)
+
+
+class SaveJournalTask(JournalTask):
+    def __init__(self, catalog, filename, text):
+        super().__init__(filename)
+        self.catalog = catalog
+        self.text = text
+
+    def work(self):
+        return self.catalog.write_entry(self.filename, self.text, self._report, lambda: self.is_cancelled)
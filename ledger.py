@@ -0,0 +1,96 @@
+import sys
+from array import array
+from bisect import bisect_right
+from datetime import datetime
+
+from habit import from_micros, to_micros
+
+# A balance snapshot follows every SNAPSHOT_EVERY transactions, so the
+# balance at any moment is a bisect plus a replay of at most that many.
+SNAPSHOT_EVERY = 128
+
+
+class PointsLedger:
+    # Append-only record of points earned and spent. Transactions are kept
+    # as parallel arrays of time (epoch microseconds, never going backwards),
+    # amount and reason; snapshots are (transactions so far, balance).
+    def __init__(self):
+        self.times = array('q')
+        self.amounts = array('q')
+        self.reasons = []
+        self.snapshot_counts = array('q')
+        self.snapshot_balances = array('q')
+        self.balance = 0
+
+    def __len__(self):
+        return len(self.amounts)
+
+    def load(self, records):
+        # Records as storage keeps them: {'at', 'amount', 'reason'} for a
+        # transaction and {'count', 'balance'} for a snapshot. The balance
+        # starts from the last snapshot, so only the tail after it is summed.
+        snapshots = []
+        for record in records:
+            if 'count' in record:
+                snapshots.append((record['count'], record['balance']))
+            else:
+                self.times.append(to_micros(datetime.fromisoformat(record['at'])))
+                self.amounts.append(record['amount'])
+                self.reasons.append(sys.intern(record['reason']))
+        # A snapshot past the last transaction comes from a torn write.
+        for count, balance in sorted(snapshots):
+            if count <= len(self.amounts):
+                self.snapshot_counts.append(count)
+                self.snapshot_balances.append(balance)
+        count, balance = self._snapshot_before(len(self.amounts))
+        self.balance = balance + sum(self.amounts[count:])
+        return self
+
+    def record(self, amount, reason, when=None):
+        # Returns the records to persist: the transaction, followed by a
+        # snapshot when one is due.
+        micros = to_micros(when or datetime.now())
+        if self.times and micros < self.times[-1]:
+            micros = self.times[-1]
+        self.times.append(micros)
+        self.amounts.append(amount)
+        self.reasons.append(sys.intern(reason))
+        self.balance += amount
+        records = [{'at': from_micros(micros).isoformat(), 'amount': amount, 'reason': reason}]
+        last = self.snapshot_counts[-1] if self.snapshot_counts else 0
+        if len(self.amounts) - last >= SNAPSHOT_EVERY:
+            self.snapshot_counts.append(len(self.amounts))
+            self.snapshot_balances.append(self.balance)
+            records.append({'count': len(self.amounts), 'balance': self.balance})
+        return records
+
+    def records(self):
+        # The ledger as load() takes it.
+        records = [{'at': from_micros(micros).isoformat(), 'amount': amount, 'reason': reason}
+                   for micros, amount, reason in zip(self.times, self.amounts, self.reasons)]
+        return records + [{'count': count, 'balance': balance}
+                          for count, balance in zip(self.snapshot_counts, self.snapshot_balances)]
+
+    def _snapshot_before(self, i):
+        j = bisect_right(self.snapshot_counts, i) - 1
+        return (self.snapshot_counts[j], self.snapshot_balances[j]) if j >= 0 else (0, 0)
+
+    def balance_at(self, when):
+        i = bisect_right(self.times, to_micros(when))
+        count, balance = self._snapshot_before(i)
+        return balance + sum(self.amounts[count:i])
+
+    def verify(self):
+        # Rebuilds each snapshot from the one before it and the transactions
+        # in between, and the current balance from all of them. Returns
+        # (transaction count, stored, rebuilt) for every mismatch.
+        problems = []
+        done, running = 0, 0
+        for count, stored in zip(self.snapshot_counts, self.snapshot_balances):
+            rebuilt = running + sum(self.amounts[done:count])
+            if rebuilt != stored:
+                problems.append((count, stored, rebuilt))
+            done, running = count, stored
+        if sum(self.amounts) != self.balance:
+            problems.append((len(self.amounts), self.balance, sum(self.amounts)))
+        return problems
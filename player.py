@@ -1,27 +1,61 @@
 import sys
+import time
+
+STARTUP_STARTED = time.perf_counter()
+# Time from process start to the first paint of the main window.
+STARTUP_TARGET_MS = 400
+
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                              QLabel, QPushButton, QListWidget, QLineEdit, QProgressBar, 
                              QListWidgetItem, QComboBox, QScrollArea, QGridLayout, QDialog,
                              QCalendarWidget, QTabWidget, QTextEdit, QMessageBox, QSplitter, QTextBrowser,
                              QTabWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, 
                              QLineEdit, QSpinBox, QListWidget, QListWidgetItem, QDialog, 
-                             QDialogButtonBox, QFormLayout, QMessageBox)
-from PyQt6.QtCore import Qt, QTimer, QPropertyAnimation, QEasingCurve, QDate, pyqtSignal
-from PyQt6.QtGui import QFont, QIcon, QColor
-import json
+                             QDialogButtonBox, QFormLayout, QMessageBox, QListView, QFileDialog,
+                             QTableWidget, QTableWidgetItem, QHeaderView)
+from PyQt6.QtCore import Qt, QObject, QTimer, QPropertyAnimation, QEasingCurve, QDate, pyqtSignal, QFileSystemWatcher, QThreadPool
+from PyQt6.QtGui import QFont, QIcon, QColor, QTextCharFormat, QShortcut, QKeySequence
 from datetime import datetime, timedelta
 import random
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 import os
-
-class Habit:
-    def __init__(self, name, category="General", streak=0, total_completions=0, last_completed=None):
-        self.name = name
-        self.category = category
-        self.streak = streak
-        self.total_completions = total_completions
-        self.last_completed = datetime.fromisoformat(last_completed) if last_completed else None
+import profiling
+import stall_watchdog
+from profiling import span
+from core import HabitCore, import_files
+from refresh import ChartRefreshScheduler
+from charts import ProgressChart, StatsCharts, Blitter
+from chart_render import ChartRenderThread, ChartImage
+from habit_model import HabitListModel, DayHabitsModel
+from journal import open_journal
+from journal_search import JournalSearchIndex
+from journal_tasks import LoadJournalTask, SaveJournalTask
+
+def create_chart(*grid, figsize):
+    # matplotlib is imported the first time a chart is shown, not at startup.
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+    figure = Figure(figsize=figsize)
+    return figure, figure.subplots(*grid), FigureCanvas(figure)
+
+# Opt-in: rasterize charts on a worker thread and show them as images.
+RENDER_CHARTS_OFF_THREAD = os.environ.get("HABIT_HERO_CHART_RENDER") == "thread"
+# How often to look for changes from other instances sharing the data files.
+EXTERNAL_POLL_MS = 2000
+# A journal search runs once typing pauses this long.
+SEARCH_DEBOUNCE_MS = 250
+
+HEATMAP_COLORS = ["#c6e48b", "#7bc96f", "#239a3b", "#196127"]
+
+class RemoteSignals(QObject):
+    delta = pyqtSignal(object)
+
+class ExternalSignals(QObject):
+    # Other instances' changes, read on the writer thread, and what to run
+    # once they are applied.
+    changes = pyqtSignal(object, object)
+
+class SearchSignals(QObject):
+    indexed = pyqtSignal()
 
 class AddRewardDialog(QDialog):
     def __init__(self, parent=None):
@@ -73,19 +107,99 @@ class HabitTracker(QMainWindow):
             }
         """)
 
-        self.habits = self.load_habits()
-        self.points = self.load_points()
-        self.rewards = self.load_rewards()
-        self.last_update = self.load_last_update()
+        self.core = HabitCore()
 
+        self.journal_index = None
+        self.journal_search = None
+        self.journal_pool = QThreadPool(self)
+        self.journal_tasks = set()
+        self.journal_load_task = None
+        self.startup_ms = None
+        self.chart_renderer = None
+        self.chart_images = {}
         self.init_ui()
         self.check_daily_reset()
 
-    def init_ui(self):
-        central_widget = QTabWidget()
-        self.setCentralWidget(central_widget)
+        self.external_signals = ExternalSignals(self)
+        self.external_signals.changes.connect(self.apply_external_changes)
+        if getattr(self.core.storage, "remote", False):
+            # Deltas arrive on the sync thread; the signal hands them to the GUI thread.
+            self.remote_signals = RemoteSignals(self)
+            self.remote_signals.delta.connect(self.apply_remote_delta)
+            self.core.storage.set_delta_handler(self.remote_signals.delta.emit)
+        else:
+            self.external_timer = QTimer(self)
+            self.external_timer.timeout.connect(self.sync_external)
+            self.external_timer.start(EXTERNAL_POLL_MS)
+
+        self.midnight_timer = QTimer(self)
+        self.midnight_timer.setSingleShot(True)
+        self.midnight_timer.timeout.connect(self.on_midnight)
+        self.schedule_midnight_rollover()
+
+        self.watchdog = None
+        if stall_watchdog.ENABLED:
+            self.watchdog = stall_watchdog.StallWatchdog()
+            self.heartbeat_timer = QTimer(self)
+            self.heartbeat_timer.timeout.connect(self.watchdog.beat)
+            self.heartbeat_timer.start(stall_watchdog.HEARTBEAT_MS)
 
-        # Main tab
+    def init_ui(self):
+        self.tabs = QTabWidget()
+        self.setCentralWidget(self.tabs)
+        self.chart_refresh = ChartRefreshScheduler(parent=self)
+
+        # Only the Main tab is built before the first paint; the other tabs
+        # are built the first time they are opened.
+        self.tab_builders = {}
+        self.tabs.addTab(self.build_main_tab(), "Main")
+        self.add_lazy_tab(self.build_stats_tab, "Statistics")
+        self.add_lazy_tab(self.build_calendar_tab, "Calendar")
+        self.add_lazy_tab(self.build_journal_tab, "Journal")
+        self.add_lazy_tab(self.build_rewards_tab, "Rewards")
+        self.tabs.currentChanged.connect(self.on_tab_changed)
+
+        # Hidden until asked for; it only has data with HABIT_HERO_PROFILE set.
+        self.diagnostics_tab = None
+        QShortcut(QKeySequence("Ctrl+Shift+D"), self, self.show_diagnostics_tab)
+
+    def add_lazy_tab(self, builder, title):
+        tab = QWidget()
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        tab.setLayout(layout)
+        self.tab_builders[tab] = builder
+        self.tabs.addTab(tab, title)
+
+    def ensure_tab_built(self, tab):
+        builder = self.tab_builders.pop(tab, None)
+        if builder:
+            tab.layout().addWidget(builder())
+
+    def on_tab_changed(self, index):
+        self.ensure_tab_built(self.tabs.widget(index))
+        self.chart_refresh.flush()
+
+    def closeEvent(self, event):
+        # Blocks until the write-behind queue is empty.
+        self.core.close()
+        if self.chart_renderer:
+            self.chart_renderer.close()
+        if profiling.ENABLED and profiling.TRACE_PATH:
+            profiling.profiler.export(profiling.TRACE_PATH)
+        if self.watchdog:
+            self.watchdog.stop()
+        super().closeEvent(event)
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.startup_ms is None:
+            self.startup_ms = (time.perf_counter() - STARTUP_STARTED) * 1000
+            if self.startup_ms > STARTUP_TARGET_MS or os.environ.get("HABIT_HERO_STARTUP_TIMING"):
+                print(f"Startup: first paint after {self.startup_ms:.0f} ms (target {STARTUP_TARGET_MS} ms)", file=sys.stderr)
+            QTimer.singleShot(0, self.build_progress_chart)
+
+    def build_main_tab(self):
         main_tab = QWidget()
         main_layout = QHBoxLayout()
         main_tab.setLayout(main_layout)
@@ -95,19 +209,21 @@ class HabitTracker(QMainWindow):
         left_widget = QWidget()
         left_layout = QVBoxLayout()
 
-        self.habit_list = QListWidget()
+        self.habit_model = HabitListModel(self.core.habits, self)
+        self.habit_list = QListView()
+        self.habit_list.setUniformItemSizes(True)
+        self.habit_list.setModel(self.habit_model)
         self.habit_list.setStyleSheet("""
-            QListWidget {
+            QListView {
                 background-color: white;
                 border-radius: 5px;
                 padding: 5px;
             }
-            QListWidget::item {
+            QListView::item {
                 padding: 5px;
                 border-bottom: 1px solid #e0e0e0;
             }
         """)
-        self.update_habit_list()
 
         new_habit_input = QLineEdit()
         new_habit_input.setPlaceholderText("Enter new habit")
@@ -124,6 +240,10 @@ class HabitTracker(QMainWindow):
         left_layout.addWidget(new_habit_input)
         left_layout.addWidget(category_combo)
         left_layout.addWidget(add_habit_btn)
+
+        import_btn = QPushButton("Import...")
+        import_btn.clicked.connect(self.choose_import_files)
+        left_layout.addWidget(import_btn)
         left_widget.setLayout(left_layout)
         left_panel.setWidget(left_widget)
         left_panel.setWidgetResizable(True)
@@ -133,7 +253,7 @@ class HabitTracker(QMainWindow):
         right_widget = QWidget()
         right_layout = QVBoxLayout()
 
-        self.points_label = QLabel(f"Points: {self.points}")
+        self.points_label = QLabel(f"Points: {self.core.points}")
         self.points_label.setFont(QFont("Arial", 18, QFont.Weight.Bold))
         self.points_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
 
@@ -161,15 +281,13 @@ class HabitTracker(QMainWindow):
 
         # Rewards section
         rewards_layout = QGridLayout()
-        for i, reward in enumerate(self.rewards):
+        for i, reward in enumerate(self.core.rewards):
             reward_btn = QPushButton(f"{reward['name']} ({reward['cost']} pts)")
             reward_btn.clicked.connect(lambda _, r=reward: self.claim_reward(r))
             rewards_layout.addWidget(reward_btn, i // 2, i % 2)
 
-        # Progress chart
-        self.figure, self.ax = plt.subplots(figsize=(5, 4))
-        self.chart_canvas = FigureCanvas(self.figure)
-        self.update_progress_chart()
+        # Progress chart, created right after the first paint
+        self.progress_chart_layout = QVBoxLayout()
 
         right_layout.addWidget(self.points_label)
         right_layout.addWidget(QLabel("Level Progress"))
@@ -178,7 +296,7 @@ class HabitTracker(QMainWindow):
         right_layout.addWidget(self.motivational_quote)
         right_layout.addWidget(QLabel("Rewards"))
         right_layout.addLayout(rewards_layout)
-        right_layout.addWidget(self.chart_canvas)
+        right_layout.addLayout(self.progress_chart_layout)
         right_layout.addStretch()
         right_widget.setLayout(right_layout)
         right_panel.setWidget(right_widget)
@@ -186,19 +304,55 @@ class HabitTracker(QMainWindow):
 
         main_layout.addWidget(left_panel, 1)
         main_layout.addWidget(right_panel, 1)
+        return main_tab
 
-        # Stats tab
+    def build_progress_chart(self):
+        if RENDER_CHARTS_OFF_THREAD:
+            self.chart_canvas = self.create_chart_image("progress", figsize=(5, 4))
+        else:
+            self.figure, self.ax, self.chart_canvas = create_chart(figsize=(5, 4))
+            self.progress_chart = ProgressChart(self.ax)
+            self.progress_blitter = Blitter(self.chart_canvas, self.progress_chart.bars)
+        self.progress_chart_layout.addWidget(self.chart_canvas)
+        self.update_progress_chart()
+        self.chart_refresh.register("progress", self.chart_canvas, self.update_progress_chart)
+
+    def build_stats_tab(self):
         stats_tab = QWidget()
         stats_layout = QVBoxLayout()
         stats_tab.setLayout(stats_layout)
 
-        self.stats_figure, self.stats_ax = plt.subplots(2, 2, figsize=(10, 8))
-        self.stats_canvas = FigureCanvas(self.stats_figure)
+        if RENDER_CHARTS_OFF_THREAD:
+            self.stats_canvas = self.create_chart_image("stats", figsize=(10, 8))
+        else:
+            self.stats_figure, self.stats_ax, self.stats_canvas = create_chart(2, 2, figsize=(10, 8))
+            self.stats_charts = StatsCharts(self.stats_ax)
+            self.stats_blitter = Blitter(self.stats_canvas)
         self.update_stats_charts()
+        self.chart_refresh.register("stats", self.stats_canvas, self.update_stats_charts)
 
         stats_layout.addWidget(self.stats_canvas)
-
-        # Calendar tab
+        return stats_tab
+
+    def create_chart_image(self, key, figsize):
+        if self.chart_renderer is None:
+            self.chart_renderer = ChartRenderThread()
+            self.chart_renderer.signals.rendered.connect(self.on_chart_rendered)
+        image = ChartImage(figsize)
+        image.resized.connect(lambda: self.chart_refresh.mark_dirty(key))
+        self.chart_images[key] = image
+        return image
+
+    def render_chart(self, key, data):
+        width, height, dpi = self.chart_images[key].render_size()
+        self.chart_renderer.submit(key, width, height, dpi, data)
+
+    def on_chart_rendered(self, key, seq, image):
+        # A result can arrive after newer data was submitted; drop it.
+        if self.chart_renderer.is_current(key, seq):
+            self.chart_images[key].show_image(image)
+
+    def build_calendar_tab(self):
         calendar_tab = QWidget()
         calendar_layout = QHBoxLayout()
         calendar_tab.setLayout(calendar_layout)
@@ -231,21 +385,26 @@ class HabitTracker(QMainWindow):
             QCalendarWidget QSpinBox::down-arrow { width: 10px; height: 10px; }
         """)
         self.calendar.clicked.connect(self.show_day_details)
+        self.calendar.currentPageChanged.connect(self.paint_calendar_heatmap)
+        self.paint_calendar_heatmap(self.calendar.yearShown(), self.calendar.monthShown())
 
         # Right side: Day details
         day_details_widget = QWidget()
         day_details_layout = QVBoxLayout()
         day_details_widget.setLayout(day_details_layout)
 
-        self.day_habits_list = QListWidget()
+        self.day_habits_model = DayHabitsModel(self.habit_model, self)
+        self.day_habits_list = QListView()
+        self.day_habits_list.setUniformItemSizes(True)
+        self.day_habits_list.setModel(self.day_habits_model)
         self.day_habits_list.setStyleSheet("""
-            QListWidget {
+            QListView {
                 background-color: #f0f0f0;
                 border: 1px solid #d0d0d0;
                 border-radius: 5px;
                 padding: 5px;
             }
-            QListWidget::item {
+            QListView::item {
                 background-color: white;
                 border: 1px solid #e0e0e0;
                 border-radius: 3px;
@@ -286,8 +445,9 @@ class HabitTracker(QMainWindow):
 
         calendar_layout.addWidget(self.calendar, 1)
         calendar_layout.addWidget(day_details_widget, 1)
+        return calendar_tab
 
-        # Journal tab
+    def build_journal_tab(self):
         journal_tab = QWidget()
         journal_layout = QVBoxLayout()
         journal_tab.setLayout(journal_layout)
@@ -327,6 +487,20 @@ class HabitTracker(QMainWindow):
         self.journal_list.itemClicked.connect(self.load_journal_entry)
         self.load_journal_list()
 
+        self.journal_search_input = QLineEdit()
+        self.journal_search_input.setPlaceholderText("Search journal")
+        self.journal_search_input.textChanged.connect(self.search_journal)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self.search_timer.timeout.connect(self.run_journal_search)
+
+        self.journal_search_results = QTextBrowser()
+        self.journal_search_results.setOpenLinks(False)
+        self.journal_search_results.anchorClicked.connect(self.open_search_result)
+        self.journal_search_results.hide()
+        self.journal_search_hits = []
+
         new_entry_btn = QPushButton("New Entry")
         new_entry_btn.setStyleSheet("""
             QPushButton {
@@ -341,7 +515,9 @@ class HabitTracker(QMainWindow):
         """)
         new_entry_btn.clicked.connect(self.new_journal_entry)
 
+        left_layout.addWidget(self.journal_search_input)
         left_layout.addWidget(self.journal_list)
+        left_layout.addWidget(self.journal_search_results)
         left_layout.addWidget(new_entry_btn)
 
         # Right panel: Entry viewer/editor
@@ -377,8 +553,19 @@ class HabitTracker(QMainWindow):
         """)
         save_journal_btn.clicked.connect(self.save_journal_entry)
 
+        # Shown while an entry is being read or written in the background
+        journal_task_layout = QHBoxLayout()
+        self.journal_progress = QProgressBar()
+        self.cancel_journal_btn = QPushButton("Cancel")
+        self.cancel_journal_btn.clicked.connect(self.cancel_journal_tasks)
+        journal_task_layout.addWidget(self.journal_progress)
+        journal_task_layout.addWidget(self.cancel_journal_btn)
+        self.journal_progress.hide()
+        self.cancel_journal_btn.hide()
+
         right_layout.addWidget(self.journal_date_label)
         right_layout.addWidget(self.journal_text)
+        right_layout.addLayout(journal_task_layout)
         right_layout.addWidget(save_journal_btn)
 
         journal_splitter.addWidget(left_panel)
@@ -387,8 +574,9 @@ class HabitTracker(QMainWindow):
         journal_splitter.setStretchFactor(1, 2)
 
         journal_layout.addWidget(journal_splitter)
+        return journal_tab
 
-        # Add Rewards tab
+    def build_rewards_tab(self):
         rewards_tab = QWidget()
         rewards_layout = QVBoxLayout()
         rewards_tab.setLayout(rewards_layout)
@@ -449,43 +637,125 @@ class HabitTracker(QMainWindow):
         rewards_layout.addWidget(self.rewards_list)
         rewards_layout.addWidget(claim_reward_btn)
         rewards_layout.addWidget(add_reward_btn)
+        return rewards_tab
+
+    def show_diagnostics_tab(self):
+        if self.diagnostics_tab is None:
+            self.diagnostics_tab = self.build_diagnostics_tab()
+            self.tabs.addTab(self.diagnostics_tab, "Diagnostics")
+        self.tabs.setCurrentWidget(self.diagnostics_tab)
+        self.update_diagnostics()
+
+    def build_diagnostics_tab(self):
+        diagnostics_tab = QWidget()
+        diagnostics_layout = QVBoxLayout()
+        diagnostics_tab.setLayout(diagnostics_layout)
+
+        if not profiling.ENABLED:
+            diagnostics_layout.addWidget(QLabel("Profiling is off. Start Habit Hero with HABIT_HERO_PROFILE=1 to collect timings."))
+
+        self.diagnostics_table = QTableWidget(0, 7)
+        self.diagnostics_table.setHorizontalHeaderLabels(["Span", "Count", "Total ms", "p50 ms", "p90 ms", "p99 ms", "Max ms"])
+        self.diagnostics_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.diagnostics_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        diagnostics_layout.addWidget(self.diagnostics_table)
+
+        button_layout = QHBoxLayout()
+        refresh_btn = QPushButton("Refresh")
+        refresh_btn.clicked.connect(self.update_diagnostics)
+        reset_btn = QPushButton("Reset")
+        reset_btn.clicked.connect(self.reset_diagnostics)
+        export_btn = QPushButton("Export Trace...")
+        export_btn.clicked.connect(self.export_diagnostics)
+        button_layout.addWidget(refresh_btn)
+        button_layout.addWidget(reset_btn)
+        button_layout.addWidget(export_btn)
+        diagnostics_layout.addLayout(button_layout)
+        return diagnostics_tab
+
+    def update_diagnostics(self):
+        rows = profiling.profiler.summary()
+        self.diagnostics_table.setRowCount(len(rows))
+        for r, row in enumerate(rows):
+            values = [row['name'], row['count'], row['total_ms'], row['p50_ms'], row['p90_ms'], row['p99_ms'], row['max_ms']]
+            for c, value in enumerate(values):
+                item = QTableWidgetItem(f"{value:.2f}" if isinstance(value, float) else str(value))
+                if c:
+                    item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+                self.diagnostics_table.setItem(r, c, item)
+
+    def reset_diagnostics(self):
+        profiling.profiler.reset()
+        self.update_diagnostics()
+
+    def export_diagnostics(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Export Trace", "habit_hero_trace.json", "Trace files (*.json)")
+        if path:
+            profiling.profiler.export(path)
 
-        # Add tabs to main widget
-        central_widget.addTab(main_tab, "Main")
-        central_widget.addTab(stats_tab, "Statistics")
-        central_widget.addTab(calendar_tab, "Calendar")
-        central_widget.addTab(journal_tab, "Journal")
-        central_widget.addTab(rewards_tab, "Rewards")
+    def add_habit(self, name, category):
+        habit = self.core.add_habit(name, category)
+        if habit:
+            self.habit_model.habits_appended([habit])
 
-    def update_habit_list(self):
-        self.habit_list.clear()
-        for habit in self.habits:
-            item = QListWidgetItem(f"🏆 {habit.name} ({habit.category}): {habit.streak} day streak")
-            self.habit_list.addItem(item)
+    def choose_import_files(self):
+        paths, _ = QFileDialog.getOpenFileNames(self, "Import Habits", "", "Habit data (*.csv *.jsonl)")
+        if paths:
+            self.import_batch(paths)
 
-    def add_habit(self, name, category):
-        if name and name not in [h.name for h in self.habits]:
-            self.habits.append(Habit(name, category))
-            self.save_habits()
-            self.update_habit_list()
+    def import_batch(self, paths):
+        try:
+            result = self.core.import_files(paths)
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "Import Failed", f"Nothing was imported.\n\n{e}")
+            return None
+        self.habit_model.habits_appended(result.new_habits)
+        for habit in result.changed_habits:
+            self.habit_model.habit_changed(habit)
+        self.points_label.setText(f"Points: {self.core.points}")
+        self.update_level_progress()
+        self.chart_refresh.mark_dirty("progress", "stats")
+        if hasattr(self, "calendar"):
+            self.paint_calendar_heatmap(self.calendar.yearShown(), self.calendar.monthShown())
+        return result
 
     def complete_habit(self):
-        current_item = self.habit_list.currentItem()
-        if current_item:
-            habit_name = current_item.text().split(":")[0].split("(")[0].strip("🏆 ")
-            habit = next(h for h in self.habits if h.name == habit_name)
-            habit.streak += 1
-            habit.total_completions += 1
-            habit.last_completed = datetime.now()
-            self.points += 10
+        current_index = self.habit_list.currentIndex()
+        if current_index.isValid():
+            habit = self.core.complete_habit(current_index.data(HabitListModel.HabitRole))
             self.animate_points()
             self.update_level_progress()
-            self.save_habits()
-            self.save_points()
-            self.update_habit_list()
+            self.habit_model.habit_changed(habit)
             self.update_motivational_quote()
-            self.update_progress_chart()
-            self.update_stats_charts()
+            self.chart_refresh.mark_dirty("progress", "stats")
+            if hasattr(self, "calendar"):
+                self.paint_calendar_heatmap(self.calendar.yearShown(), self.calendar.monthShown())
+
+    def apply_remote_delta(self, message):
+        self.show_synced_changes(*self.core.apply_remote(message))
+
+    def sync_external(self, then=None):
+        # The store is read on the writer thread; its changes come back here
+        # through the signal and `then` runs after they are applied.
+        self.core.sync(lambda changes: self.external_signals.changes.emit(changes, then))
+
+    def apply_external_changes(self, changes, then):
+        if changes:
+            self.show_synced_changes(*self.core.apply_external(changes))
+        if then:
+            then()
+
+    def show_synced_changes(self, new, changed):
+        self.habit_model.habits_appended(new)
+        for habit in changed:
+            self.habit_model.habit_changed(habit)
+        self.points_label.setText(f"Points: {self.core.points}")
+        self.update_level_progress()
+        if hasattr(self, "rewards_list"):
+            self.update_rewards_list()
+        self.chart_refresh.mark_dirty("progress", "stats")
+        if hasattr(self, "calendar"):
+            self.paint_calendar_heatmap(self.calendar.yearShown(), self.calendar.monthShown())
 
     def animate_points(self):
         animation = QPropertyAnimation(self.points_label, b"pos")
@@ -494,11 +764,10 @@ class HabitTracker(QMainWindow):
         animation.setEndValue(self.points_label.pos().y() - 20)
         animation.setEasingCurve(QEasingCurve.Type.OutBounce)
         animation.start()
-        QTimer.singleShot(500, lambda: self.points_label.setText(f"Points: {self.points}"))
+        QTimer.singleShot(500, lambda: self.points_label.setText(f"Points: {self.core.points}"))
 
     def update_level_progress(self):
-        level = self.points // 100
-        progress = self.points % 100
+        level, progress = self.core.level_progress()
         self.level_progress.setValue(progress)
         self.level_progress.setFormat(f"Level {level} - {progress}%")
 
@@ -513,129 +782,216 @@ class HabitTracker(QMainWindow):
         self.motivational_quote.setText(random.choice(quotes))
 
     def check_daily_reset(self):
-        today = datetime.now().date()
-        if self.last_update != str(today):
-            self.reset_daily_habits()
-            self.last_update = str(today)
-            self.save_last_update()
-
-    def reset_daily_habits(self):
-        for habit in self.habits:
-            if habit.last_completed and (datetime.now() - habit.last_completed).days > 1:
-                habit.streak = 0
-        self.save_habits()
-        self.update_habit_list()
+        for habit in self.core.check_daily_reset():
+            self.habit_model.habit_changed(habit)
+
+    def schedule_midnight_rollover(self):
+        now = datetime.now()
+        midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        # A second late so the new date is definitely visible to datetime.now().
+        self.midnight_timer.start(int((midnight - now).total_seconds() * 1000) + 1000)
+
+    def on_midnight(self):
+        self.check_daily_reset()
+        self.chart_refresh.mark_dirty("progress", "stats")
+        self.schedule_midnight_rollover()
 
     def claim_reward(self, reward):
-        if self.points >= reward['cost']:
-            self.points -= reward['cost']
-            self.points_label.setText(f"Points: {self.points}")
-            self.save_points()
+        # The balance may have been spent from another instance.
+        self.sync_external(lambda: self.finish_claim_reward(reward))
+
+    def finish_claim_reward(self, reward):
+        if self.core.claim_reward(reward):
+            self.points_label.setText(f"Points: {self.core.points}")
             QMessageBox.information(self, "Reward Claimed", f"You've claimed the reward: {reward['name']}")
 
     def update_progress_chart(self):
-        self.ax.clear()
-        dates = [datetime.now().date() - timedelta(days=i) for i in range(7)][::-1]
-        completions = [sum(1 for h in self.habits if h.last_completed and h.last_completed.date() == date) for date in dates]
-        
-        self.ax.bar(range(7), completions)
-        self.ax.set_xticks(range(7))
-        self.ax.set_xticklabels([date.strftime('%d/%m') for date in dates], rotation=45)
-        self.ax.set_ylabel('Habits Completed')
-        self.ax.set_title('Habit Completion Progress')
-        
-        self.figure.tight_layout()
-        self.chart_canvas.draw()
+        dates, completions = self.core.progress_series(7)
+        if RENDER_CHARTS_OFF_THREAD:
+            self.render_chart("progress", (dates, completions))
+        elif self.progress_chart.update(dates, completions):
+            with span("progress_chart.tight_layout"):
+                self.figure.tight_layout()
+            self.chart_canvas.draw_idle()
+        else:
+            # Only bar heights changed: repaint them over the cached axes.
+            with span("progress_chart.blit"):
+                self.progress_blitter.update()
 
     def update_stats_charts(self):
-        for ax in self.stats_ax.flat:
-            ax.clear()
-
-        # Habit completion by category
-        categories = set(h.category for h in self.habits)
-        category_completions = {cat: sum(h.total_completions for h in self.habits if h.category == cat) for cat in categories}
-        self.stats_ax[0, 0].pie(category_completions.values(), labels=category_completions.keys(), autopct='%1.1f%%')
-        self.stats_ax[0, 0].set_title('Habit Completion by Category')
-
-        # Top 5 habits by streak
-        top_habits = sorted(self.habits, key=lambda h: h.streak, reverse=True)[:5]
-        self.stats_ax[0, 1].barh([h.name for h in top_habits], [h.streak for h in top_habits])
-        self.stats_ax[0, 1].set_title('Top 5 Habits by Streak')
-
-        # Total completions over time
-        dates = [datetime.now().date() - timedelta(days=i) for i in range(30)][::-1]
-        total_completions = [sum(1 for h in self.habits if h.last_completed and h.last_completed.date() <= date) for date in dates]
-        self.stats_ax[1, 0].plot(dates, total_completions)
-        self.stats_ax[1, 0].set_title('Total Completions Over Time')
-        self.stats_ax[1, 0].set_xticks([dates[0], dates[-1]])
-        self.stats_ax[1, 0].set_xticklabels([dates[0].strftime('%d/%m'), dates[-1].strftime('%d/%m')])
-
-        # Points earned over time
-        self.stats_ax[1, 1].plot(dates, [i * 10 for i in total_completions])
-        self.stats_ax[1, 1].set_title('Points Earned Over Time')
-        self.stats_ax[1, 1].set_xticks([dates[0], dates[-1]])
-        self.stats_ax[1, 1].set_xticklabels([dates[0].strftime('%d/%m'), dates[-1].strftime('%d/%m')])
-
-        self.stats_figure.tight_layout()
-        self.stats_canvas.draw()
+        dates, total_completions = self.core.completion_series(30)
+        _, total_points = self.core.points_series(30)
+        data = (self.core.category_totals(), self.core.top_streaks(5), dates, total_completions, total_points)
+        if RENDER_CHARTS_OFF_THREAD:
+            self.render_chart("stats", data)
+            return
+        if self.stats_charts.update(*data):
+            with span("stats_charts.tight_layout"):
+                self.stats_figure.tight_layout()
+            self.stats_blitter.set_artists(self.stats_charts.artists())
+            self.stats_canvas.draw_idle()
+        else:
+            # Only bars, lines and wedges moved: repaint them over the cached axes.
+            with span("stats_charts.blit"):
+                self.stats_blitter.update()
 
     def show_day_details(self, date):
         self.update_day_habits(date)
         self.update_day_journal_preview(date)
 
     def update_day_habits(self, date):
-        self.day_habits_list.clear()
-        selected_date = date.toPyDate()
-        for habit in self.habits:
-            if habit.last_completed and habit.last_completed.date() == selected_date:
-                self.day_habits_list.addItem(f"✅ {habit.name}")
-            else:
-                self.day_habits_list.addItem(f"❌ {habit.name}")
+        self.day_habits_model.set_completed(self.core.habits_on(date.toPyDate()))
+
+    def paint_calendar_heatmap(self, year, month):
+        # Clears the previous month's colours, then shades each day by its
+        # share of the busiest day in the month.
+        self.calendar.setDateTextFormat(QDate(), QTextCharFormat())
+        counts = self.core.month_counts(year, month)
+        busiest = max(counts.values(), default=0)
+        for day, count in counts.items():
+            shade = HEATMAP_COLORS[min(len(HEATMAP_COLORS) - 1, (count * len(HEATMAP_COLORS) - 1) // busiest)]
+            fmt = QTextCharFormat()
+            fmt.setBackground(QColor(shade))
+            fmt.setToolTip(f"{count} completed")
+            self.calendar.setDateTextFormat(QDate(day.year, day.month, day.day), fmt)
+
+    def get_journal_index(self):
+        # Built on first use so startup never scans the journal directory.
+        if self.journal_index is None:
+            self.journal_index = open_journal(self.core.storage.writer)
+            self.journal_watcher = QFileSystemWatcher(self.journal_index.watch_paths(), self)
+            self.journal_watcher.directoryChanged.connect(self.on_journal_directory_changed)
+            self.journal_watcher.fileChanged.connect(self.on_journal_directory_changed)
+        return self.journal_index
+
+    def get_journal_search(self):
+        if self.journal_search is None:
+            self.journal_search = JournalSearchIndex(self.get_journal_index(), writer=self.core.storage.writer)
+            # Indexing finishes on the writer thread; the signal brings the
+            # news back so a search shown meanwhile is run again.
+            self.search_signals = SearchSignals(self)
+            self.search_signals.indexed.connect(self.rerun_journal_search)
+            self.journal_search.sync(self.get_journal_index().entries.values(), self.search_signals.indexed.emit)
+        return self.journal_search
+
+    def on_journal_directory_changed(self, path):
+        watched = set(self.journal_watcher.files() + self.journal_watcher.directories())
+        new_paths = [p for p in self.journal_index.watch_paths() if p not in watched]
+        if new_paths:
+            self.journal_watcher.addPaths(new_paths)
+        if self.journal_index.sync():
+            if self.journal_search:
+                self.journal_search.sync(self.journal_index.entries.values(), self.search_signals.indexed.emit)
+            if hasattr(self, "journal_list"):
+                self.load_journal_list()
+
+    def search_journal(self, query):
+        if not query.strip():
+            self.search_timer.stop()
+            self.journal_search_results.hide()
+            self.journal_list.show()
+            return
+        self.search_timer.start()
+
+    def rerun_journal_search(self):
+        # A pending search will see the new index anyway.
+        if not self.journal_search_results.isHidden() and not self.search_timer.isActive():
+            self.run_journal_search()
+
+    def run_journal_search(self):
+        query = self.journal_search_input.text()
+        if not query.strip():
+            return
+        self.journal_search_hits = self.get_journal_search().search(query)
+        if self.journal_search_hits:
+            html = "".join(f'<p><a href="result:{i}">{hit.label}</a><br>{hit.snippet}</p>'
+                           for i, hit in enumerate(self.journal_search_hits))
+        else:
+            html = "<p>No matching entries.</p>"
+        self.journal_search_results.setHtml(html)
+        self.journal_list.hide()
+        self.journal_search_results.show()
+
+    def open_search_result(self, url):
+        hit = self.journal_search_hits[int(url.toString().split(":")[1])]
+        self.load_journal_entry(QListWidgetItem(hit.label))
 
     def update_day_journal_preview(self, date):
-        date_str = date.toString("yyyy-MM-dd")
-        journal_files = [f for f in os.listdir() if f.startswith(f"journal_{date_str}") and f.endswith(".txt")]
-        if journal_files:
-            with open(journal_files[0], "r") as f:
-                content = f.read()
-            preview = content[:200] + "..." if len(content) > 200 else content
-            self.day_journal_preview.setText(preview)
+        entries = self.get_journal_index().entries_on(date.toString("yyyy-MM-dd"))
+        if entries:
+            self.day_journal_preview.setText(entries[0].preview)
         else:
             self.day_journal_preview.setText("No journal entry for this day.")
 
     def open_full_journal_entry(self):
         selected_date = self.calendar.selectedDate()
-        date_str = selected_date.toString("yyyy-MM-dd")
-        journal_files = [f for f in os.listdir() if f.startswith(f"journal_{date_str}") and f.endswith(".txt")]
-        if journal_files:
-            self.load_journal_entry(QListWidgetItem(date_str.replace("-", " ")))
+        entries = self.get_journal_index().entries_on(selected_date.toString("yyyy-MM-dd"))
+        if entries:
             self.centralWidget().setCurrentIndex(3)  # Switch to the Journal tab
+            self.load_journal_entry(QListWidgetItem(entries[0].label))
         else:
             QMessageBox.information(self, "No Entry", "There is no journal entry for this day.")
 
     def load_journal_list(self):
         self.journal_list.clear()
-        journal_files = [f for f in os.listdir() if f.startswith("journal_") and f.endswith(".txt")]
-        journal_files.sort(reverse=True)
-        for file in journal_files:
-            date_str = file[8:-4].replace("_", " ")
-            item = QListWidgetItem(date_str)
+        for entry in self.get_journal_index().all_entries():
+            item = QListWidgetItem(entry.label)
             item.setIcon(QIcon("path_to_journal_icon.png"))  # Add an appropriate icon
             self.journal_list.addItem(item)
 
+    def start_journal_task(self, task):
+        self.journal_tasks.add(task)
+        task.signals.progress.connect(self.journal_progress.setValue)
+        task.signals.finished.connect(lambda *_: self.finish_journal_task(task))
+        task.signals.failed.connect(lambda *_: self.finish_journal_task(task))
+        task.signals.cancelled.connect(lambda *_: self.finish_journal_task(task))
+        self.journal_progress.setValue(0)
+        self.journal_progress.show()
+        self.cancel_journal_btn.show()
+        self.journal_pool.start(task)
+
+    def finish_journal_task(self, task):
+        self.journal_tasks.discard(task)
+        if not self.journal_tasks:
+            self.journal_progress.hide()
+            self.cancel_journal_btn.hide()
+
+    def cancel_journal_tasks(self):
+        for task in self.journal_tasks:
+            task.cancel()
+
     def load_journal_entry(self, item):
-        date_str = item.text().replace(" ", "_")
-        filename = f"journal_{date_str}.txt"
-        try:
-            with open(filename, "r") as f:
-                content = f.read()
-            self.journal_date_label.setText(f"Entry for {item.text()}")
-            self.journal_text.setPlainText(content)
-        except FileNotFoundError:
+        label = item.text()
+        # Only the most recently requested entry is worth finishing.
+        if self.journal_load_task:
+            self.journal_load_task.cancel()
+            self.journal_load_task = None
+        entry = self.get_journal_index().entries.get(f"journal_{label.replace(' ', '_')}.txt")
+        if entry is None:
+            self.show_journal_entry(None, label, None)
+            return
+        task = LoadJournalTask(entry)
+        task.signals.finished.connect(lambda _, content: self.show_journal_entry(task, label, content))
+        task.signals.failed.connect(lambda *_: self.show_journal_entry(task, label, None))
+        self.journal_load_task = task
+        self.journal_date_label.setText(f"Loading {label}...")
+        self.start_journal_task(task)
+
+    def show_journal_entry(self, task, label, content):
+        if task is not self.journal_load_task:
+            return
+        self.journal_load_task = None
+        if content is None:
             self.journal_date_label.setText("No entry found")
             self.journal_text.clear()
+        else:
+            self.journal_date_label.setText(f"Entry for {label}")
+            self.journal_text.setPlainText(content)
 
     def new_journal_entry(self):
+        if self.journal_load_task:
+            self.journal_load_task.cancel()
+            self.journal_load_task = None
         self.journal_date_label.setText(f"New Entry - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         self.journal_text.clear()
 
@@ -643,16 +999,21 @@ class HabitTracker(QMainWindow):
         entry = self.journal_text.toPlainText()
         if entry:
             date = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-            filename = f"journal_{date}.txt"
-            with open(filename, "w") as f:
-                f.write(entry)
-            QMessageBox.information(self, "Journal Saved", "Your journal entry has been saved.")
-            self.load_journal_list()
-            self.journal_list.setCurrentRow(0)  # Select the most recent entry
+            task = SaveJournalTask(self.get_journal_index(), f"journal_{date}.txt", entry)
+            task.signals.finished.connect(lambda _, saved: self.journal_entry_saved(saved))
+            task.signals.failed.connect(lambda _, error: QMessageBox.warning(self, "Journal Not Saved", error))
+            self.start_journal_task(task)
+
+    def journal_entry_saved(self, entry):
+        self.journal_index.add_entry(entry)
+        self.get_journal_search().update_entry(entry, self.search_signals.indexed.emit)
+        QMessageBox.information(self, "Journal Saved", "Your journal entry has been saved.")
+        self.load_journal_list()
+        self.journal_list.setCurrentRow(0)  # Select the most recent entry
 
     def update_rewards_list(self):
         self.rewards_list.clear()
-        for reward in self.rewards:
+        for reward in self.core.rewards:
             self.rewards_list.addItem(RewardItem(reward))
 
     def claim_selected_reward(self):
@@ -662,10 +1023,12 @@ class HabitTracker(QMainWindow):
             return
 
         reward = selected_items[0].reward
-        if self.points >= reward['cost']:
-            self.points -= reward['cost']
-            self.points_label.setText(f"Points: {self.points}")
-            self.save_points()
+        self.sync_external(lambda: self.finish_claim_selected_reward(reward))
+
+    def finish_claim_selected_reward(self, reward):
+        if self.core.claim_reward(reward):
+            self.points_label.setText(f"Points: {self.core.points}")
+            self.chart_refresh.mark_dirty("stats")
             self.reward_claimed.emit(reward['name'])
             QMessageBox.information(self, "Reward Claimed", f"You've claimed the reward: {reward['name']}")
         else:
@@ -678,79 +1041,22 @@ class HabitTracker(QMainWindow):
                 'name': dialog.name_input.text(),
                 'cost': dialog.cost_input.value()
             }
-            self.rewards.append(new_reward)
-            self.save_rewards()
+            self.core.add_reward(new_reward)
             self.update_rewards_list()
 
-    def save_rewards(self):
-        with open("rewards.json", "w") as f:
-            json.dump(self.rewards, f)
-
-    def load_habits(self):
-        try:
-            with open("habits.json", "r") as f:
-                data = json.load(f)
-                habits = []
-                for item in data:
-                    if isinstance(item, str):
-                        habits.append(Habit(name=item))
-                    elif isinstance(item, dict):
-                        habits.append(Habit(
-                            name=item['name'],
-                            category=item.get('category', 'General'),
-                            streak=item.get('streak', 0),
-                            total_completions=item.get('total_completions', 0),
-                            last_completed=item.get('last_completed')
-                        ))
-                return habits
-        except FileNotFoundError:
-            return []
-
-    def save_habits(self):
-        with open("habits.json", "w") as f:
-            json.dump([{
-                'name': h.name,
-                'category': h.category,
-                'streak': h.streak,
-                'total_completions': h.total_completions,
-                'last_completed': h.last_completed.isoformat() if h.last_completed else None
-            } for h in self.habits], f)
-
-    def load_points(self):
-        try:
-            with open("points.json", "r") as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return 0
-
-    def save_points(self):
-        with open("points.json", "w") as f:
-            json.dump(self.points, f)
-
-    def load_rewards(self):
-        try:
-            with open("rewards.json", "r") as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return [
-                {"name": "1 Hour of TV", "cost": 50},
-                {"name": "Favorite Snack", "cost": 100},
-                {"name": "Movie Night", "cost": 200},
-                {"name": "New Book", "cost": 300},
-            ]
-
-    def load_last_update(self):
-        try:
-            with open("last_update.json", "r") as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return str(datetime.now().date())
-
-    def save_last_update(self):
-        with open("last_update.json", "w") as f:
-            json.dump(self.last_update, f)
+profiling.instrument(HabitTracker, handlers=(
+    "add_habit", "import_batch", "complete_habit", "claim_reward", "claim_selected_reward", "finish_claim_reward",
+    "finish_claim_selected_reward", "add_new_reward", "apply_external_changes", "on_tab_changed",
+    "show_day_details", "paint_calendar_heatmap", "run_journal_search", "check_daily_reset", "on_midnight",
+    "new_journal_entry", "journal_entry_saved", "build_progress_chart", "build_stats_tab",
+    "build_calendar_tab", "build_journal_tab", "build_rewards_tab"))
 
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["import"]:
+        if len(sys.argv) < 3:
+            print("usage: python player.py import FILE.csv|FILE.jsonl [...]", file=sys.stderr)
+            sys.exit(2)
+        sys.exit(import_files(sys.argv[2:]))
     app = QApplication(sys.argv)
     window = HabitTracker()
     window.show()
@@ -0,0 +1,152 @@
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Opt-in: with HABIT_HERO_PROFILE unset nothing is wrapped and span() hands
+# back a shared no-op context manager.
+ENABLED = bool(os.environ.get("HABIT_HERO_PROFILE"))
+TRACE_PATH = os.environ.get("HABIT_HERO_TRACE")
+SAMPLES_PER_SPAN = 2048
+MAX_TRACE_EVENTS = 100000
+PREFIXES = ("update_", "save_", "load_")
+
+
+class SpanStats:
+    __slots__ = ("count", "total", "worst", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.worst = 0.0
+        # Percentiles come from the most recent samples only, so memory stays
+        # bounded however long the app runs.
+        self.samples = deque(maxlen=SAMPLES_PER_SPAN)
+
+    def add(self, ms):
+        self.count += 1
+        self.total += ms
+        self.worst = max(self.worst, ms)
+        self.samples.append(ms)
+
+    def percentile(self, q):
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))] if ordered else 0.0
+
+
+class Profiler:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.stats = {}
+        self.events = deque(maxlen=MAX_TRACE_EVENTS)
+
+    def record(self, name, start, end):
+        ms = (end - start) * 1000
+        with self.lock:
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = SpanStats()
+            stats.add(ms)
+            # Chrome trace "complete" events; timestamps are microseconds.
+            self.events.append({
+                'name': name, 'ph': "X", 'pid': os.getpid(), 'tid': threading.get_ident(),
+                'ts': round((start - self.origin) * 1e6, 1), 'dur': round(ms * 1000, 1),
+            })
+
+    def summary(self):
+        with self.lock:
+            rows = [{
+                'name': name,
+                'count': stats.count,
+                'total_ms': round(stats.total, 3),
+                'p50_ms': round(stats.percentile(50), 3),
+                'p90_ms': round(stats.percentile(90), 3),
+                'p99_ms': round(stats.percentile(99), 3),
+                'max_ms': round(stats.worst, 3),
+            } for name, stats in self.stats.items()]
+        return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+            self.events.clear()
+
+    def export(self, path):
+        with self.lock:
+            events = list(self.events)
+        with open(path, "w") as f:
+            json.dump({'traceEvents': events, 'summary': self.summary()}, f)
+
+
+class Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        profiler.record(self.name, self.start, time.perf_counter())
+        return False
+
+
+class NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = NullSpan()
+profiler = Profiler()
+
+
+def span(name):
+    return Span(name) if ENABLED else NULL_SPAN
+
+
+def timed(fn, name):
+    # Qt passes signal arguments (e.g. clicked's `checked`) to any slot that
+    # takes *args, so the wrapper drops the extras the method cannot accept,
+    # the same way PyQt does for the unwrapped method.
+    params = inspect.signature(fn).parameters.values()
+    limit = None
+    if not any(p.kind == p.VAR_POSITIONAL for p in params):
+        limit = sum(p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD) for p in params)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if limit is not None:
+            args = args[:limit]
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.record(name, start, time.perf_counter())
+    return wrapper
+
+
+def instrument(cls, handlers=(), prefixes=PREFIXES):
+    # Wraps the class's own update_*/save_*/load_* methods plus the named
+    # handlers. Does nothing unless profiling is on.
+    if not ENABLED:
+        return cls
+    for attr, value in list(vars(cls).items()):
+        if inspect.isfunction(value) and (attr in handlers or attr.startswith(prefixes)):
+            setattr(cls, attr, timed(value, f"{cls.__name__}.{attr}"))
+    return cls
+
+
+def instrument_function(module, attr):
+    if ENABLED:
+        setattr(module, attr, timed(getattr(module, attr), f"{module.__name__}.{attr}"))
@@ -0,0 +1,33 @@
+from PyQt6.QtCore import QObject, QTimer
+
+
+class ChartRefreshScheduler(QObject):
+    def __init__(self, delay_ms=150, parent=None):
+        super().__init__(parent)
+        self.charts = {}
+        self.dirty = set()
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay_ms)
+        self.timer.timeout.connect(self.flush)
+
+    def register(self, name, widget, render):
+        # Called right after the chart's first render, so it starts clean.
+        self.charts[name] = (widget, render)
+        self.dirty.discard(name)
+
+    def mark_dirty(self, *names):
+        self.dirty.update(names)
+        # Don't restart a running timer, so a steady stream of clicks still
+        # gets a redraw at most delay_ms after the first one.
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def flush(self):
+        for name in list(self.dirty):
+            if name not in self.charts:
+                continue
+            widget, render = self.charts[name]
+            if widget.isVisible():
+                self.dirty.discard(name)
+                render()
@@ -0,0 +1,181 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+import profiling
+from profiling import SpanStats
+
+# Opt-in: HABIT_HERO_WATCHDOG=1 reports event loop stalls over THRESHOLD_MS,
+# or over the number of milliseconds it is set to. The report goes to
+# HABIT_HERO_STALL_REPORT (stall_report.txt by default).
+SETTING = os.environ.get("HABIT_HERO_WATCHDOG", "")
+ENABLED = bool(SETTING)
+THRESHOLD_MS = int(SETTING) if SETTING.isdigit() and int(SETTING) > 1 else 250
+REPORT_PATH = os.environ.get("HABIT_HERO_STALL_REPORT", "stall_report.txt")
+HEARTBEAT_MS = 50
+SAMPLE_MS = 20
+# A stall this long is reported while it is still going, in case it never ends.
+HANG_REPORT_MS = 5000
+MAX_STALLS = 200
+MAX_DEPTH = 64
+TOP_HANDLERS = 10
+TOP_STACKS = 3
+QT_FRAME = ("Qt", 0, "event loop")
+
+
+def frame_stack(frame):
+    # Outermost call first, as (file, line, function); no source lines are
+    # read, so a sample costs a walk over the frames and nothing more.
+    stack = []
+    while frame is not None and len(stack) < MAX_DEPTH:
+        code = frame.f_code
+        stack.append((code.co_filename, frame.f_lineno, getattr(code, "co_qualname", code.co_name)))
+        frame = frame.f_back
+    return tuple(reversed(stack))
+
+
+def handler_of(stack):
+    # The first frame Qt called into: below the app.exec() frame and past
+    # any profiling wrapper.
+    for frame in stack[1:]:
+        if os.path.basename(frame[0]) != "profiling.py":
+            return frame
+    # Nothing but app.exec(): the time went to Qt itself (layout, painting),
+    # or the loop was already idle again when the sample was taken.
+    return QT_FRAME
+
+
+def describe(frame):
+    if frame == QT_FRAME:
+        return "Qt event loop (no Python frames)"
+    return f"{frame[2]} ({os.path.basename(frame[0])}:{frame[1]})"
+
+
+class Stall:
+    __slots__ = ("start", "end", "samples")
+
+    def __init__(self, start):
+        self.start = start
+        self.end = None
+        self.samples = Counter()
+
+    def duration_ms(self, now=None):
+        return ((self.end or now or time.perf_counter()) - self.start) * 1000
+
+
+class StallWatchdog:
+    # A GUI-thread timer calls beat() every HEARTBEAT_MS; how late each beat
+    # is, is the event loop latency. A worker thread checks the last beat
+    # every SAMPLE_MS and, once the loop has been stuck for threshold_ms,
+    # samples the GUI thread's stack until the beats resume. Between stalls
+    # the worker only reads a float.
+    def __init__(self, threshold_ms=THRESHOLD_MS, report_path=REPORT_PATH):
+        self.threshold_ms = threshold_ms
+        self.report_path = report_path
+        self.gui_thread = threading.get_ident()
+        self.latency = SpanStats()
+        self.last_beat = None
+        self.stalls = deque(maxlen=MAX_STALLS)
+        self.current = None
+        self.hang_reported = False
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="stall-watchdog", daemon=True)
+
+    def beat(self):
+        now = time.perf_counter()
+        if self.last_beat is None:
+            # Armed by the first beat, so startup before the event loop
+            # runs does not count as a stall.
+            self.last_beat = now
+            self.thread.start()
+            return
+        self.latency.add(max(0.0, (now - self.last_beat) * 1000 - HEARTBEAT_MS))
+        self.last_beat = now
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        self.write_report()
+
+    def _run(self):
+        while not self.stopped.wait(SAMPLE_MS / 1000):
+            beat = self.last_beat
+            now = time.perf_counter()
+            stall = self.current
+            if stall is not None and beat > stall.start:
+                self._finish(stall, beat)
+                stall = None
+            if (now - beat) * 1000 - HEARTBEAT_MS < self.threshold_ms:
+                continue
+            frame = sys._current_frames().get(self.gui_thread)
+            if frame is None:
+                continue
+            stack = frame_stack(frame)
+            del frame
+            with self.lock:
+                if stall is None:
+                    stall = self.current = Stall(beat)
+                stall.samples[stack] += 1
+            if not self.hang_reported and stall.duration_ms(now) > HANG_REPORT_MS:
+                self.hang_reported = True
+                self.write_report()
+
+    def _finish(self, stall, beat):
+        with self.lock:
+            stall.end = beat
+            self.stalls.append(stall)
+            self.current = None
+        self.hang_reported = False
+        if profiling.ENABLED:
+            profiling.profiler.record("event_loop.stall", stall.start, stall.end)
+        self.write_report()
+
+    def summary(self):
+        # Handlers ranked by total stalled time, each with its most sampled
+        # stacks. A stall's time goes to the handler seen in most samples.
+        with self.lock:
+            stalls = list(self.stalls) + ([self.current] if self.current else [])
+            stalls = [(stall.duration_ms(), Counter(stall.samples)) for stall in stalls]
+        handlers = {}
+        for duration, samples in stalls:
+            by_handler = Counter()
+            for stack, count in samples.items():
+                by_handler[handler_of(stack)] += count
+            handler = by_handler.most_common(1)[0][0]
+            entry = handlers.setdefault(handler, {'handler': handler, 'count': 0, 'total_ms': 0.0,
+                                                  'max_ms': 0.0, 'stacks': Counter()})
+            entry['count'] += 1
+            entry['total_ms'] += duration
+            entry['max_ms'] = max(entry['max_ms'], duration)
+            entry['stacks'].update(samples)
+        return sorted(handlers.values(), key=lambda entry: entry['total_ms'], reverse=True)
+
+    def report(self):
+        handlers = self.summary()
+        lines = [
+            f"Event loop stalls over {self.threshold_ms} ms: {sum(h['count'] for h in handlers)}, "
+            f"{sum(h['total_ms'] for h in handlers) / 1000:.1f} s in total",
+            f"Heartbeat latency over {self.latency.count} beats: p50 {self.latency.percentile(50):.1f} ms, "
+            f"p99 {self.latency.percentile(99):.1f} ms, max {self.latency.worst:.1f} ms",
+        ]
+        for rank, entry in enumerate(handlers[:TOP_HANDLERS], 1):
+            lines += ["", f"{rank}. {describe(entry['handler'])}: {entry['count']} stalls, "
+                          f"{entry['total_ms']:.0f} ms total, {entry['max_ms']:.0f} ms worst"]
+            samples = sum(entry['stacks'].values())
+            for stack, count in entry['stacks'].most_common(TOP_STACKS):
+                lines.append(f"   {100 * count / samples:.0f}% of samples:")
+                handler = handler_of(stack)
+                lines += [f"      {describe(frame)}" for frame in (stack[stack.index(handler):] if handler in stack else [handler])]
+        return "\n".join(lines) + "\n"
+
+    def write_report(self):
+        try:
+            with open(self.report_path + ".tmp", "w") as f:
+                f.write(self.report())
+            os.replace(self.report_path + ".tmp", self.report_path)
+        except OSError as e:
+            print(f"stall watchdog: cannot write {self.report_path}: {e}", file=sys.stderr)
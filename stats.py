@@ -0,0 +1,75 @@
+from datetime import timedelta
+
+import numpy as np
+
+
+class StatsEngine:
+    def __init__(self, habits):
+        self.names = []
+        self.rows = {}
+        self.categories = []
+        self.category_codes = {}
+        capacity = max(16, len(habits))
+        self.codes = np.zeros(capacity, dtype=np.int32)
+        self.streaks = np.zeros(capacity, dtype=np.int64)
+        self.totals = np.zeros(capacity, dtype=np.int64)
+        for habit in habits:
+            self.add(habit)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _code(self, category):
+        code = self.category_codes.get(category)
+        if code is None:
+            code = self.category_codes[category] = len(self.categories)
+            self.categories.append(category)
+        return code
+
+    def add(self, habit):
+        row = len(self.names)
+        if row == len(self.streaks):
+            # Grow by doubling so appends stay amortised O(1).
+            self.codes = np.resize(self.codes, row * 2)
+            self.streaks = np.resize(self.streaks, row * 2)
+            self.totals = np.resize(self.totals, row * 2)
+        self.names.append(habit.name)
+        self.rows[habit.name] = row
+        self.codes[row] = self._code(habit.category)
+        self.update(habit)
+
+    def update(self, habit):
+        row = self.rows[habit.name]
+        self.codes[row] = self._code(habit.category)
+        self.streaks[row] = habit.streak
+        self.totals[row] = habit.total_completions
+
+    def category_totals(self):
+        n = len(self.names)
+        sums = np.bincount(self.codes[:n], weights=self.totals[:n], minlength=len(self.categories))
+        present = np.bincount(self.codes[:n], minlength=len(self.categories)) > 0
+        return {self.categories[code]: int(sums[code]) for code in np.flatnonzero(present)}
+
+    def top_streaks(self, k=5):
+        n = len(self.names)
+        k = min(k, n)
+        if not k:
+            return []
+        streaks = self.streaks[:n]
+        if k < n:
+            # Every row tied with the k-th streak is a candidate, so the
+            # lexsort below can pick the lowest rows among the ties.
+            kth = -np.partition(-streaks, k - 1)[k - 1]
+            candidates = np.flatnonzero(streaks >= kth)
+        else:
+            candidates = np.arange(n)
+        # Highest streak first; ties keep habit order, like a stable sort.
+        order = candidates[np.lexsort((candidates, -streaks[candidates]))][:k]
+        return [(self.names[row], int(streaks[row])) for row in order]
+
+    def cumulative_series(self, log, first_day, days):
+        # Completions on or before each of the `days` days starting at first_day.
+        dates = [first_day + timedelta(days=i) for i in range(days)]
+        before = log.cumulative_counts([first_day - timedelta(days=1)])[0]
+        daily = np.fromiter(log.counts_for_days(dates), dtype=np.int64, count=days)
+        return dates, before + np.cumsum(daily)
@@ -0,0 +1,779 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+import profiling
+from archive import HistoryArchive
+from habit import decode_habits, dump_habits, encode_habit, habit_rows, load_habits_text
+from locking import FileLock
+from profiling import span
+
+DEFAULT_REWARDS = [
+    {"name": "1 Hour of TV", "cost": 50},
+    {"name": "Favorite Snack", "cost": 100},
+    {"name": "Movie Night", "cost": 200},
+    {"name": "New Book", "cost": 300},
+]
+
+
+def write_json_atomic(filename, data):
+    write_text_atomic(filename, json.dumps(data))
+
+
+def write_text_atomic(filename, text):
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filename, filename)
+
+
+def open_storage():
+    writer = WriteBehindWriter()
+    # HABIT_HERO_SYNC=host:port keeps habits on a shared sync server instead.
+    if os.environ.get("HABIT_HERO_SYNC"):
+        import getpass
+        from sync_client import RemoteStorage
+        user = os.environ.get("HABIT_HERO_USER") or getpass.getuser()
+        return RemoteStorage(os.environ["HABIT_HERO_SYNC"], user, writer)
+    # SQLite is opt-in; once habits.db exists it stays the source of truth.
+    if os.environ.get("HABIT_HERO_STORAGE") == "sqlite" or os.path.exists("habits.db"):
+        return SqliteStorage("habits.db", writer)
+    return JsonStorage(writer)
+
+
+class WriteBehindWriter:
+    def __init__(self):
+        self.jobs = {}
+        self.in_flight = 0
+        self.closed = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self.thread.start()
+
+    def submit(self, key, job):
+        # Jobs with the same key replace each other while queued, so a burst
+        # of saves to one file becomes a single write. The replacement moves to
+        # the back of the queue so it still runs after anything submitted
+        # before it. key=None never merges.
+        with self.condition:
+            if key is None:
+                key = object()
+            self.jobs.pop(key, None)
+            self.jobs[key] = job
+            self.condition.notify_all()
+
+    @property
+    def pending_writes(self):
+        with self.condition:
+            return len(self.jobs) + self.in_flight
+
+    def flush(self):
+        with self.condition:
+            while self.jobs or self.in_flight:
+                self.condition.wait()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.jobs and not self.closed:
+                    self.condition.wait()
+                if not self.jobs:
+                    return
+                batch = list(self.jobs.values())
+                self.jobs.clear()
+                self.in_flight = len(batch)
+            with span("WriteBehindWriter.batch"):
+                for job in batch:
+                    try:
+                        job()
+                    except Exception:
+                        traceback.print_exc(file=sys.stderr)
+            with self.condition:
+                self.in_flight = 0
+                self.condition.notify_all()
+
+
+def completion_lines(events):
+    return "".join(json.dumps({'habit': name, 'at': when.isoformat()}) + "\n" for name, when in events)
+
+
+def first_completion(events, archive=None):
+    # No later than the earliest completion known: the oldest event, or the
+    # first of the oldest archived month. Now when there are none.
+    first = min((when for name, when in events), default=datetime.now())
+    if archive is not None and archive.order:
+        first = min(first, datetime(*archive.order[0], 1))
+    return min(first, datetime.now())
+
+
+def opening_record(points, at=None):
+    # Books a balance from before the ledger existed. It was earned before
+    # any completion on record, so it is dated no later than the first one.
+    return {'at': (at or datetime.now()).isoformat(), 'amount': points, 'reason': "opening"}
+
+
+def file_stamp(filename):
+    # Changes whenever another process writes the file: appends change the
+    # size and mtime, atomic replaces also change the inode.
+    try:
+        st = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+def merge_rows(rows, theirs, totals):
+    # Habits only the other instance has are kept, and for habits both have
+    # the later completion wins. Counts come from `totals` rather than from
+    # either side's rows, whose views of each other's completions differ.
+    index = {habit.name: habit for habit in theirs}
+    merged = []
+    for name, category, streak, total, last in rows:
+        other = index.pop(name, None)
+        if other is not None and other.last_micros is not None and (last is None or other.last_micros > last):
+            streak, last = other.streak, other.last_micros
+        merged.append((name, category, streak, totals.get(name, 0), last))
+    merged += [(h.name, h.category, h.streak, totals.get(h.name, h.total_completions), h.last_micros)
+               for h in theirs if h.name in index]
+    return merged
+
+
+class ExternalChanges:
+    # What other processes sharing the store wrote since this one last
+    # looked, for HabitCore.apply_external().
+    def __init__(self):
+        self.habits = []
+        self.completions = []
+        self.ledger = []
+        self.rewards = None
+        self.last_update = None
+
+    def __bool__(self):
+        return bool(self.habits or self.completions or self.ledger
+                    or self.rewards is not None or self.last_update is not None)
+
+
+class JsonStorage:
+    LOGS = ("completions.jsonl", "points_ledger.jsonl")
+    WATCHED = ("habits.json", "completions.jsonl", "points_ledger.jsonl", "rewards.json", "last_update.json")
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.archive = HistoryArchive()
+        # Every read and write of the data files holds this lock, so several
+        # app instances can share a directory. Each file's stamp as this
+        # instance last left it tells whether anyone else has written since;
+        # logs are then read on from the offset reached so far.
+        self.lock = FileLock("habit_hero.lock")
+        self.stamps = {}
+        self.offsets = {}
+        self.external = ExternalChanges()
+        # Transactions and balance of the ledger file, so points.json and
+        # snapshots written here match it even with other writers.
+        self.ledger_count = 0
+        self.ledger_balance = 0
+        # Dates an opening ledger entry; set when the completions are loaded.
+        self.first_completion = None
+        # Counts in habits.json as last read or written here, and this
+        # instance's completions not written there yet. A write adds the
+        # second to the first, so every instance's completions count once.
+        self.habit_totals = {}
+        self.increments = Counter()
+        self.count_lock = threading.Lock()
+
+    def _seen(self, filename):
+        self.stamps[filename] = stamp = file_stamp(filename)
+        if filename in self.LOGS:
+            self.offsets[filename] = stamp[1] if stamp else 0
+
+    def _read(self, filename, default):
+        self.writer.flush()
+        with self.lock:
+            self._seen(filename)
+            try:
+                with open(filename, "r") as f:
+                    return json.load(f)
+            except FileNotFoundError:
+                return default
+
+    def _submit(self, key, filename, write, others=()):
+        # Runs on the writer thread: take in what other instances wrote, then
+        # write on top of it, all under the lock. `others` are further files
+        # the write touches.
+        def job():
+            with self.lock:
+                for other in others:
+                    self._catch_up(other)
+                theirs = self._catch_up(filename)
+                write(theirs)
+                for written in (filename,) + tuple(others):
+                    self._seen(written)
+
+        self.writer.submit(key, job)
+
+    def _write(self, filename, data):
+        self._submit(filename, filename, lambda theirs: write_json_atomic(filename, data))
+
+    def _catch_up(self, filename):
+        # Called with the lock held. Queues another instance's changes to
+        # filename for poll() and returns what was read, or None.
+        stamp = file_stamp(filename)
+        seen = self.stamps.get(filename)
+        if stamp == seen:
+            return None
+        self.stamps[filename] = stamp
+        if filename in self.LOGS:
+            offset = self.offsets.get(filename, 0)
+            if stamp is None or (seen is not None and stamp[2] != seen[2]) or stamp[1] < offset:
+                # Replaced by another instance archiving old history; what
+                # it kept is already known here.
+                self.offsets[filename] = stamp[1] if stamp else 0
+                return None
+            with open(filename, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+            # A torn last line is left for the next look.
+            data = data[:data.rfind(b"\n") + 1]
+            self.offsets[filename] = offset + len(data)
+            records = [json.loads(line) for line in data.splitlines() if line.strip()]
+            if filename == "completions.jsonl":
+                self.external.completions += [(r['habit'], datetime.fromisoformat(r['at'])) for r in records]
+            else:
+                records = [r for r in records if 'count' not in r]
+                self.ledger_count += len(records)
+                self.ledger_balance += sum(r['amount'] for r in records)
+                self.external.ledger += records
+            return records
+        if stamp is None:
+            return None
+        with open(filename, "r") as f:
+            text = f.read()
+        if filename == "habits.json":
+            habits = load_habits_text(text)
+            self.habit_totals = {habit.name: habit.total_completions for habit in habits}
+            self.external.habits += habits
+            return habits
+        data = json.loads(text)
+        if filename == "rewards.json":
+            self.external.rewards = data
+        elif filename == "last_update.json":
+            self.external.last_update = data
+        return data
+
+    def poll(self, handler):
+        # Runs on the writer thread, so the lock is never waited for on the
+        # caller's: one stat per file when nothing changed. handler gets the
+        # pending ExternalChanges, or None, on that thread.
+        def job():
+            if any(file_stamp(f) != self.stamps.get(f) for f in self.WATCHED):
+                with self.lock:
+                    for filename in self.WATCHED:
+                        self._catch_up(filename)
+            changes, self.external = self.external, ExternalChanges()
+            handler(changes or None)
+
+        self.writer.submit(None, job)
+
+    def close(self):
+        self.writer.close()
+        self.lock.close()
+
+    @contextmanager
+    def loading(self):
+        # HabitCore loads everything inside one hold of the lock. Writes
+        # made while loading are done in place, not on the writer thread,
+        # which would wait for the lock.
+        self.writer.flush()
+        with self.lock:
+            yield
+
+    def load_habits(self):
+        self.writer.flush()
+        with self.lock:
+            self._seen("habits.json")
+            try:
+                with open("habits.json", "r") as f:
+                    habits = load_habits_text(f.read())
+            except FileNotFoundError:
+                habits = []
+            self.habit_totals = {habit.name: habit.total_completions for habit in habits}
+            return habits
+
+    def save_habits(self, habits, changed=None):
+        rows = habit_rows(habits)
+
+        def write(theirs):
+            with self.count_lock:
+                increments, self.increments = self.increments, Counter()
+            for name, count in increments.items():
+                self.habit_totals[name] = self.habit_totals.get(name, 0) + count
+            merged = merge_rows(rows, theirs or (), self.habit_totals)
+            write_text_atomic("habits.json", dump_habits(merged))
+            self.habit_totals = {row[0]: row[3] for row in merged}
+
+        self._submit("habits.json", "habits.json", write)
+
+    def _count(self, events):
+        with self.count_lock:
+            self.increments.update(name for name, when in events)
+
+    def load_completions(self, seed=()):
+        # Starts the log with `seed` if there is none, then moves what the
+        # archive takes out of it and returns the rest. All of it happens
+        # in one hold of the lock, so instances starting together neither
+        # seed twice nor seal over each other.
+        self.writer.flush()
+        with self.lock:
+            if os.path.exists("completions.jsonl"):
+                events = []
+                with open("completions.jsonl", "r") as f:
+                    for line in f:
+                        line = line.strip()
+                        if line:
+                            event = json.loads(line)
+                            events.append((event['habit'], datetime.fromisoformat(event['at'])))
+            else:
+                events = list(seed)
+                write_text_atomic("completions.jsonl", completion_lines(events))
+            self.first_completion = first_completion(events, self.archive.load())
+            hot = self.archive.seal(events, datetime.now().date())
+            if len(hot) != len(events):
+                write_text_atomic("completions.jsonl", completion_lines(hot))
+            self._seen("completions.jsonl")
+        return hot
+
+    def _append(self, filename, lines):
+        def append(theirs):
+            with open(filename, "a") as f:
+                f.write(lines)
+
+        self._submit(None, filename, append)
+
+    def append_completions(self, events):
+        self._append("completions.jsonl", completion_lines(events))
+
+    def record_completion(self, habit, habits, points, ledger=()):
+        events = [(habit.name, habit.last_completed)]
+        self._count(events)
+        self.save_habits(habits, [habit])
+        self._record(events, ledger)
+
+    def record_batch(self, habits, changed, events, points, ledger=()):
+        self._count(events)
+        self.save_habits(habits, changed)
+        self._record(events, ledger)
+
+    def _record(self, events, ledger):
+        # Separate files cannot commit together, but the events, their
+        # ledger entries and points.json are written in one hold of the
+        # lock, so no other instance reads one without the others.
+        lines = completion_lines(events)
+        ledger = list(ledger)
+
+        def write(theirs):
+            if lines:
+                with open("completions.jsonl", "a") as f:
+                    f.write(lines)
+            self._append_ledger(ledger)
+            write_json_atomic("points.json", self.ledger_balance)
+
+        self._submit(None, "completions.jsonl", write, ("points_ledger.jsonl", "points.json"))
+
+    def load_ledger(self):
+        # Once the ledger exists it is the record, and a points.json that
+        # disagrees is rewritten from it. Only with no ledger at all is the
+        # balance in points.json booked as an opening transaction. Both
+        # reads happen in one hold of the lock.
+        self.writer.flush()
+        with self.lock:
+            points = self._read("points.json", 0)
+            if os.path.exists("points_ledger.jsonl"):
+                with open("points_ledger.jsonl", "r") as f:
+                    records = [json.loads(line) for line in f if line.strip()]
+            else:
+                records = [opening_record(points, self.first_completion)] if points else []
+                write_text_atomic("points_ledger.jsonl", "".join(json.dumps(r) + "\n" for r in records))
+            transactions = [r['amount'] for r in records if 'count' not in r]
+            self.ledger_count, self.ledger_balance = len(transactions), sum(transactions)
+            if points != self.ledger_balance:
+                write_json_atomic("points.json", self.ledger_balance)
+            self._seen("points_ledger.jsonl")
+            self._seen("points.json")
+        return records
+
+    def _append_ledger(self, records):
+        # Called with the lock held and the file caught up. Snapshots are
+        # retaken against the file, which may hold transactions this
+        # instance had not seen when it took them.
+        lines = []
+        for record in records:
+            if 'count' in record:
+                record = {'count': self.ledger_count, 'balance': self.ledger_balance}
+            else:
+                self.ledger_count += 1
+                self.ledger_balance += record['amount']
+            lines.append(json.dumps(record) + "\n")
+        if lines:
+            with open("points_ledger.jsonl", "a") as f:
+                f.write("".join(lines))
+
+    def load_points(self):
+        # The ledger is the record; points.json mirrors its balance.
+        return self._read("points.json", 0)
+
+    def save_points(self, points, ledger=()):
+        if ledger:
+            self._record([], ledger)
+        else:
+            self._submit("points.json", "points.json", lambda theirs: write_json_atomic("points.json", self.ledger_balance))
+
+    def load_rewards(self):
+        return self._read("rewards.json", DEFAULT_REWARDS)
+
+    def save_rewards(self, rewards):
+        self._write("rewards.json", list(rewards))
+
+    def load_last_update(self):
+        return self._read("last_update.json", str(datetime.now().date()))
+
+    def save_last_update(self, last_update):
+        self._write("last_update.json", last_update)
+
+
+class SqliteStorage:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS habits (
+            position INTEGER NOT NULL,
+            name TEXT PRIMARY KEY,
+            category TEXT NOT NULL,
+            streak INTEGER NOT NULL,
+            total_completions INTEGER NOT NULL,
+            last_completed TEXT
+        );
+        CREATE INDEX IF NOT EXISTS habits_position ON habits (position);
+        CREATE TABLE IF NOT EXISTS completions (
+            id INTEGER PRIMARY KEY,
+            habit TEXT NOT NULL,
+            at TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS ledger (
+            id INTEGER PRIMARY KEY,
+            at TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            reason TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS ledger_snapshots (
+            count INTEGER PRIMARY KEY,
+            balance INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS state (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, path, writer):
+        self.path = path
+        self.writer = writer
+        # Writes run on the writer thread, reads on the GUI thread after a flush.
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self.archive = HistoryArchive()
+        # Newest rows this instance knows, so rows other processes commit
+        # can be picked up incrementally; data_version moves on each commit
+        # made by another connection.
+        self.data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        self.seen = {}
+        self.seen_state = {}
+        self.external = ExternalChanges()
+        self.ledger_count = 0
+        self.ledger_balance = 0
+        self.first_completion = None
+        # The check and the migration share one write transaction, so of two
+        # instances opening a new database only the first migrates; the
+        # second waits for it and then reads "migrated".
+        with self._transaction():
+            if self._get("migrated") is None:
+                self.migrate_from_json(JsonStorage(writer))
+            self._mark_seen()
+
+    def migrate_from_json(self, source):
+        habits = [encode_habit(h) for h in source.load_habits()]
+        completions = source.load_completions([(h['name'], datetime.fromisoformat(h['last_completed']))
+                                               for h in habits if h.get('last_completed')])
+        with self._transaction():
+            self._upsert_habits(habits, 0)
+            self._insert_completions(completions)
+            self._insert_ledger(source.load_ledger())
+            self._set("points", source.load_points())
+            self._set("rewards", source.load_rewards())
+            self._set("last_update", source.load_last_update())
+            self._set("migrated", datetime.now().isoformat())
+
+    def close(self):
+        self.writer.close()
+        self.conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE, unless already inside loading()'s.
+        if self.conn.in_transaction:
+            yield
+            return
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            yield
+
+    def loading(self):
+        # HabitCore loads everything inside one write transaction, so it
+        # reads one state of the database and its first-run writes and
+        # archiving commit with it.
+        self.writer.flush()
+        return self._transaction()
+
+    def _submit(self, key, work):
+        # BEGIN IMMEDIATE takes the database write lock up front, so other
+        # processes' commits are read in before anything is written.
+        def job():
+            with self.conn:
+                self.conn.execute("BEGIN IMMEDIATE")
+                self._catch_up()
+                work()
+                self._mark_seen()
+
+        self.writer.submit(key, job)
+
+    def _mark_seen(self):
+        for table, column in (("completions", "id"), ("ledger", "id"), ("habits", "position")):
+            self.seen[table] = self.conn.execute(f"SELECT COALESCE(MAX({column}), -1) FROM {table}").fetchone()[0]
+        for key, value in self.conn.execute("SELECT key, value FROM state WHERE key IN ('rewards', 'last_update')"):
+            self.seen_state[key] = value
+
+    def _catch_up(self):
+        # Queues rows other processes committed since _mark_seen() for poll().
+        external = self.external
+        external.habits += decode_habits([
+            {'name': name, 'category': category, 'streak': streak,
+             'total_completions': total_completions, 'last_completed': last_completed}
+            for name, category, streak, total_completions, last_completed in self.conn.execute("""
+                SELECT name, category, streak, total_completions, last_completed FROM habits
+                WHERE position > ? ORDER BY position
+            """, (self.seen['habits'],))])
+        external.completions += [(name, datetime.fromisoformat(at)) for name, at in self.conn.execute(
+            "SELECT habit, at FROM completions WHERE id > ? ORDER BY id", (self.seen['completions'],))]
+        records = [{'at': at, 'amount': amount, 'reason': reason} for at, amount, reason in self.conn.execute(
+            "SELECT at, amount, reason FROM ledger WHERE id > ? ORDER BY id", (self.seen['ledger'],))]
+        self.ledger_count += len(records)
+        self.ledger_balance += sum(r['amount'] for r in records)
+        external.ledger += records
+        for key, value in self.conn.execute("SELECT key, value FROM state WHERE key IN ('rewards', 'last_update')"):
+            if self.seen_state.get(key) != value:
+                setattr(external, key, json.loads(value))
+
+    def poll(self, handler):
+        # As for JSON, on the writer thread: one pragma when nothing changed,
+        # otherwise the new rows are read inside a transaction.
+        def job():
+            version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            if version != self.data_version:
+                self.data_version = version
+                with self.conn:
+                    self.conn.execute("BEGIN IMMEDIATE")
+                    self._catch_up()
+                    self._mark_seen()
+            changes, self.external = self.external, ExternalChanges()
+            handler(changes or None)
+
+        self.writer.submit(None, job)
+
+    def _get(self, key, default=None):
+        self.writer.flush()
+        row = self.conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        if row:
+            self.seen_state[key] = row[0]
+        return json.loads(row[0]) if row else default
+
+    def _set(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def _upsert_habits(self, records, first_position):
+        rows = []
+        for position, record in enumerate(records, first_position):
+            if isinstance(record, str):
+                record = {'name': record}
+            rows.append((position, record['name'], record.get('category', 'General'), record.get('streak', 0),
+                         record.get('total_completions', 0), record.get('last_completed')))
+        # An existing row's count only moves by the increments in
+        # record_completion and record_batch, and its last completion never
+        # goes backwards, so a row saved from a stale view of another
+        # instance's completions cannot undo or repeat them.
+        self.conn.executemany("""
+            INSERT INTO habits (position, name, category, streak, total_completions, last_completed)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET category = excluded.category, streak = excluded.streak,
+                last_completed = CASE WHEN last_completed > excluded.last_completed
+                                      THEN last_completed ELSE excluded.last_completed END
+        """, rows)
+
+    def _insert_completions(self, events):
+        self.conn.executemany("INSERT INTO completions (habit, at) VALUES (?, ?)",
+                              [(name, when.isoformat()) for name, when in events])
+
+    def load_habits(self):
+        self.writer.flush()
+        rows = self.conn.execute("""
+            SELECT position, name, category, streak, total_completions, last_completed FROM habits ORDER BY position
+        """).fetchall()
+        self.seen['habits'] = rows[-1][0] if rows else -1
+        return [{'name': name, 'category': category, 'streak': streak,
+                 'total_completions': total_completions, 'last_completed': last_completed}
+                for _, name, category, streak, total_completions, last_completed in rows]
+
+    def save_habits(self, habits, changed=None):
+        if changed is None:
+            records = [encode_habit(h) for h in habits]
+            self._submit("habits", lambda: self._upsert_habits(records, 0))
+        else:
+            records = [encode_habit(h) for h in changed]
+            self._submit(None, lambda: self._upsert_habits(records, self._next_position()))
+
+    def _next_position(self):
+        # Positions only matter for new rows, which always go at the end.
+        return self.conn.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM habits").fetchone()[0]
+
+    def load_completions(self, seed=()):
+        # Moves what the archive takes out of the table and returns the rest;
+        # the write transaction keeps other instances from sealing at the
+        # same time. Migration already seeded the table.
+        self.writer.flush()
+        with self._transaction():
+            events = [(name, datetime.fromisoformat(at))
+                      for name, at in self.conn.execute("SELECT habit, at FROM completions ORDER BY id")]
+            self.first_completion = first_completion(events, self.archive.load())
+            hot = self.archive.seal(events, datetime.now().date())
+            if len(hot) != len(events):
+                self.conn.execute("DELETE FROM completions")
+                self._insert_completions(hot)
+            self.seen['completions'] = self.conn.execute("SELECT COALESCE(MAX(id), -1) FROM completions").fetchone()[0]
+        return hot
+
+    def append_completions(self, events):
+        events = list(events)
+        self._submit(None, lambda: self._insert_completions(events))
+
+    def record_completion(self, habit, habits, points, ledger=()):
+        at = habit.last_completed.isoformat()
+        row = (habit.streak, at, at, habit.name)
+        event = (habit.name, habit.last_completed)
+        ledger = list(ledger)
+
+        # One habit row, its ledger entries, the balance and the event commit
+        # together. The count is incremented in place so concurrent
+        # instances both count.
+        def work():
+            self.conn.execute("""
+                UPDATE habits SET streak = ?, total_completions = total_completions + 1,
+                    last_completed = CASE WHEN last_completed > ? THEN last_completed ELSE ? END
+                WHERE name = ?
+            """, row)
+            self._insert_ledger(ledger)
+            self._set("points", self.ledger_balance)
+            self._insert_completions([event])
+
+        self._submit(None, work)
+
+    def record_batch(self, habits, changed, events, points, ledger=()):
+        # New rows start at zero; every row then gains its events.
+        records = [dict(encode_habit(h), total_completions=0) for h in changed]
+        counts = Counter(name for name, when in events)
+        events = list(events)
+        ledger = list(ledger)
+
+        def work():
+            self._upsert_habits(records, self._next_position())
+            self.conn.executemany("UPDATE habits SET total_completions = total_completions + ? WHERE name = ?",
+                                  [(count, name) for name, count in counts.items()])
+            self._insert_ledger(ledger)
+            self._set("points", self.ledger_balance)
+            self._insert_completions(events)
+
+        self._submit(None, work)
+
+    def _insert_ledger(self, records):
+        # Snapshots are retaken against the table, which may hold
+        # transactions this instance has not seen yet.
+        for record in records:
+            if 'count' in record:
+                self.conn.execute("INSERT OR REPLACE INTO ledger_snapshots (count, balance) VALUES (?, ?)",
+                                  (self.ledger_count, self.ledger_balance))
+            else:
+                self.conn.execute("INSERT INTO ledger (at, amount, reason) VALUES (?, ?, ?)",
+                                  (record['at'], record['amount'], record['reason']))
+                self.ledger_count += 1
+                self.ledger_balance += record['amount']
+
+    def load_ledger(self):
+        # As for JSON: the ledger table wins over state.points, which only
+        # opens an empty ledger; all in one transaction.
+        self.writer.flush()
+        with self._transaction():
+            row = self.conn.execute("SELECT value FROM state WHERE key = 'points'").fetchone()
+            points = json.loads(row[0]) if row else 0
+            if points and not self.conn.execute("SELECT 1 FROM ledger LIMIT 1").fetchone():
+                self.ledger_count = self.ledger_balance = 0
+                self._insert_ledger([opening_record(points, self.first_completion)])
+            rows = self.conn.execute("SELECT id, at, amount, reason FROM ledger ORDER BY id").fetchall()
+            self.seen['ledger'] = rows[-1][0] if rows else -1
+            records = [{'at': at, 'amount': amount, 'reason': reason} for _, at, amount, reason in rows]
+            self.ledger_count, self.ledger_balance = len(records), sum(r['amount'] for r in records)
+            if points != self.ledger_balance:
+                self._set("points", self.ledger_balance)
+            snapshots = self.conn.execute("SELECT count, balance FROM ledger_snapshots").fetchall()
+        return records + [{'count': count, 'balance': balance} for count, balance in snapshots]
+
+    def load_points(self):
+        return self._get("points", 0)
+
+    def save_points(self, points, ledger=()):
+        # Mirrors the ledger table rather than this instance's view of it.
+        ledger = list(ledger)
+
+        def work():
+            self._insert_ledger(ledger)
+            self._set("points", self.ledger_balance)
+
+        self._submit("points" if not ledger else None, work)
+
+    def load_rewards(self):
+        return self._get("rewards", DEFAULT_REWARDS)
+
+    def save_rewards(self, rewards):
+        rewards = list(rewards)
+        self._submit("rewards", lambda: self._set("rewards", rewards))
+
+    def load_last_update(self):
+        return self._get("last_update", str(datetime.now().date()))
+
+    def save_last_update(self, last_update):
+        self._submit("last_update", lambda: self._set("last_update", last_update))
+
+
+profiling.instrument_function(sys.modules[__name__], "write_json_atomic")
+profiling.instrument(JsonStorage, handlers=("record_completion", "record_batch"))
+profiling.instrument(SqliteStorage, handlers=("record_completion", "record_batch"))
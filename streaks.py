@@ -0,0 +1,134 @@
+from collections import defaultdict
+from datetime import date
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def epoch_day(day):
+    return day.toordinal() - EPOCH_ORDINAL
+
+
+class StreakBitmap:
+    __slots__ = ("origin", "bits")
+
+    # Bit i (little-endian across the bytes) is set when the habit was
+    # completed on epoch day origin + i.
+    def __init__(self, origin):
+        self.origin = origin - origin % 8
+        self.bits = bytearray()
+
+    def _grow(self, day):
+        # Makes room for `day`; returns its bit index.
+        i = day - self.origin
+        if i < 0:
+            pad = (-i + 7) // 8
+            self.bits[:0] = bytes(pad)
+            self.origin -= pad * 8
+            i += pad * 8
+        if i // 8 >= len(self.bits):
+            self.bits.extend(bytes(i // 8 - len(self.bits) + 1))
+        return i
+
+    def set(self, day):
+        i = self._grow(day)
+        self.bits[i // 8] |= 1 << (i % 8)
+
+    def set_mask(self, first, mask):
+        # Sets day first + i for every bit i of mask: grow to cover both
+        # ends, then OR the mask in at once.
+        self._grow(first + mask.bit_length() - 1)
+        self._grow(first)
+        bits = int.from_bytes(self.bits, "little") | mask << (first - self.origin)
+        self.bits[:] = bits.to_bytes(len(self.bits), "little")
+
+    def is_set(self, day):
+        i = day - self.origin
+        return 0 <= i < len(self.bits) * 8 and bool(self.bits[i // 8] & (1 << (i % 8)))
+
+    def run_ending(self, day):
+        # Length of the run of completed days that ends on `day`.
+        if not self.is_set(day):
+            return 0
+        i = day - self.origin
+        mask = (1 << (i + 1)) - 1
+        gaps = ~int.from_bytes(self.bits, "little") & mask
+        return i + 1 if not gaps else i - (gaps.bit_length() - 1)
+
+    def streak_as_of(self, day):
+        # A streak stays alive until the end of the day after its last completion.
+        return self.run_ending(day) or self.run_ending(day - 1)
+
+    def longest(self):
+        x = int.from_bytes(self.bits, "little")
+        length = 0
+        while x:
+            x &= x >> 1
+            length += 1
+        return length
+
+
+class StreakEngine:
+    def __init__(self):
+        self.bitmaps = {}
+        self.last_day = {}
+        # Epoch day of last completion -> habit names, so a rollover only
+        # touches the habits whose streak can have just ended.
+        self.by_last_day = defaultdict(set)
+
+    def load(self, log, habits=()):
+        for name, first, mask in log.sealed_days:
+            self.record_mask(name, first, mask)
+        for name, completions in log.by_habit.items():
+            for when in completions:
+                self.record(name, when.date())
+        # Habits whose last completion is no longer in the log still need
+        # to be found by broken().
+        for habit in habits:
+            if habit.last_micros is not None and habit.name not in self.last_day:
+                self._touch(habit.name, habit.last_day)
+        return self
+
+    def record(self, name, day):
+        day = epoch_day(day)
+        bitmap = self.bitmaps.get(name)
+        if bitmap is None:
+            bitmap = self.bitmaps[name] = StreakBitmap(day)
+        bitmap.set(day)
+        self._touch(name, day)
+
+    def record_mask(self, name, first, mask):
+        # Completions on first + i for every bit i of mask.
+        first = epoch_day(first)
+        bitmap = self.bitmaps.get(name)
+        if bitmap is None:
+            bitmap = self.bitmaps[name] = StreakBitmap(first)
+        bitmap.set_mask(first, mask)
+        self._touch(name, first + mask.bit_length() - 1)
+
+    def _touch(self, name, day):
+        last = self.last_day.get(name)
+        if last is None or day > last:
+            if last is not None:
+                self.by_last_day[last].discard(name)
+            self.last_day[name] = day
+            self.by_last_day[day].add(name)
+
+    def current(self, name, today):
+        return self.streak_as_of(name, today)
+
+    def streak_as_of(self, name, day):
+        bitmap = self.bitmaps.get(name)
+        return bitmap.streak_as_of(epoch_day(day)) if bitmap else 0
+
+    def longest(self, name):
+        bitmap = self.bitmaps.get(name)
+        return bitmap.longest() if bitmap else 0
+
+    def broken(self, today):
+        # Habits last completed before yesterday; their buckets are dropped
+        # once reported since they can only come back through record().
+        cutoff = epoch_day(today) - 1
+        names = set()
+        for day in [d for d in self.by_last_day if d < cutoff]:
+            names |= self.by_last_day.pop(day)
+        return names
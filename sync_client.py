@@ -0,0 +1,264 @@
+import asyncio
+import json
+import sys
+import threading
+import uuid
+from contextlib import nullcontext
+from datetime import datetime
+
+CONNECT_TIMEOUT = 5
+RECONNECT_DELAY = 2
+
+
+def parse_address(address):
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+class SyncClient:
+    # One persistent connection to the sync server. Every server message goes
+    # to on_message; ops stay queued until acknowledged and are resent after
+    # a reconnect (the server ignores ids it has already applied).
+    def __init__(self, host, port, user, on_message=None):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.on_message = on_message
+        self.version = 0
+        self.unacked = {}
+        self.acks = {}
+        self.reader = None
+        self.writer = None
+        self.read_task = None
+
+    @property
+    def connected(self):
+        return self.read_task is not None and not self.read_task.done()
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, limit=2 ** 24), CONNECT_TIMEOUT)
+        self._write({'op': "hello", 'user': self.user, 'since': self.version})
+        # The server answers with a snapshot, or with the missed deltas
+        # followed by "current".
+        while True:
+            message = await self._read()
+            self._dispatch(message)
+            if message['op'] in ("snapshot", "current"):
+                break
+            if message['op'] == "error":
+                raise ConnectionError(message.get('error'))
+        for message in self.unacked.values():
+            self._write(message)
+        self.read_task = asyncio.create_task(self._read_loop())
+        return self
+
+    async def close(self):
+        if self.read_task:
+            self.read_task.cancel()
+        if self.writer:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def wait_closed(self):
+        try:
+            await self.read_task
+        except asyncio.CancelledError:
+            pass
+
+    def send(self, op, **fields):
+        message = dict(fields, op=op, id=uuid.uuid4().hex)
+        self.unacked[message['id']] = message
+        if self.connected:
+            self._write(message)
+        return message['id']
+
+    async def request(self, op, **fields):
+        op_id = self.send(op, **fields)
+        future = self.acks[op_id] = asyncio.get_running_loop().create_future()
+        return await future
+
+    def _write(self, message):
+        self.writer.write(json.dumps(message).encode() + b"\n")
+
+    async def _read(self):
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("sync server closed the connection")
+        return json.loads(line)
+
+    async def _read_loop(self):
+        try:
+            while True:
+                self._dispatch(await self._read())
+        except (ConnectionError, ValueError):
+            pass
+
+    def _dispatch(self, message):
+        op = message.get('op')
+        if op == "ack":
+            self.unacked.pop(message.get('id'), None)
+            future = self.acks.pop(message.get('id'), None)
+            if future and not future.done():
+                future.set_result(message)
+        elif op in ("snapshot", "delta", "current"):
+            self.version = max(self.version, message['version']) if op == "delta" else message['version']
+        if self.on_message:
+            self.on_message(message)
+
+
+class RemoteStorage:
+    # Storage backend for the app when HABIT_HERO_SYNC=host:port is set. The
+    # core loads from the server's snapshot and its writes become ops; the
+    # connection runs on its own asyncio thread and reconnects on its own.
+    # Deltas go to the handler set with set_delta_handler(), on that thread.
+    remote = True
+    archive = None
+
+    def __init__(self, address, user, writer):
+        # Kept for local-only files such as the journal.
+        self.writer = writer
+        host, port = parse_address(address)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="sync-client", daemon=True)
+        self.thread.start()
+        self.lock = threading.Lock()
+        self.handler = None
+        self.backlog = []
+        self.snapshot = None
+        self.own_ops = set()
+        self.names = set()
+        self.client = SyncClient(host, port, user, self._on_message)
+        self.closing = False
+        try:
+            self._call(self.client.connect()).result(CONNECT_TIMEOUT * 2)
+        except Exception:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            raise
+        self.points = self.snapshot['points']
+        self.names.update(record['name'] for record in self.snapshot['habits'])
+        self.supervisor = self._call(self._supervise())
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def _supervise(self):
+        while not self.closing:
+            await self.client.wait_closed()
+            while not self.closing:
+                await asyncio.sleep(RECONNECT_DELAY)
+                try:
+                    await self.client.connect()
+                    break
+                except (OSError, ConnectionError, asyncio.TimeoutError) as e:
+                    print(f"sync: reconnect failed: {e}", file=sys.stderr)
+
+    def _on_message(self, message):
+        if message['op'] == "snapshot" and self.snapshot is None:
+            self.snapshot = message
+            return
+        if message['op'] not in ("delta", "snapshot"):
+            return
+        for record in message['habits']:
+            self.names.add(record['name'])
+        if message.get('op_id') in self.own_ops:
+            self.own_ops.discard(message['op_id'])
+            message['own'] = True
+        with self.lock:
+            if self.handler is None:
+                self.backlog.append(message)
+                return
+            handler = self.handler
+        handler(message)
+
+    def set_delta_handler(self, handler):
+        with self.lock:
+            backlog, self.backlog = self.backlog, []
+            self.handler = handler
+        for message in backlog:
+            handler(message)
+
+    def _send(self, op, **fields):
+        def send():
+            self.own_ops.add(self.client.send(op, **fields))
+        self.loop.call_soon_threadsafe(send)
+
+    async def _drain(self):
+        while self.client.unacked and self.client.connected:
+            await asyncio.sleep(0.05)
+
+    def close(self):
+        # Gives queued ops a chance to be acknowledged before disconnecting.
+        try:
+            self._call(asyncio.wait_for(self._drain(), CONNECT_TIMEOUT)).result()
+        except asyncio.TimeoutError:
+            print(f"sync: closing with {len(self.client.unacked)} unacknowledged ops", file=sys.stderr)
+        self.closing = True
+        self._call(self.client.close()).result(CONNECT_TIMEOUT)
+        self.supervisor.cancel()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.writer.close()
+
+    def loading(self):
+        return nullcontext()
+
+    def load_habits(self):
+        return self.snapshot['habits']
+
+    def save_habits(self, habits, changed=None):
+        # Streak resets are the server's job; only new habits are sent.
+        for habit in habits if changed is None else changed:
+            if habit.name not in self.names:
+                self.names.add(habit.name)
+                self._send("add_habit", name=habit.name, category=habit.category)
+
+    def load_completions(self, seed=()):
+        return [(name, datetime.fromisoformat(at)) for name, at in self.snapshot['completions']]
+
+    def append_completions(self, events):
+        pass
+
+    def record_completion(self, habit, habits, points, ledger=()):
+        self.points = points
+        self._send("complete", habit=habit.name, at=habit.last_completed.isoformat())
+
+    def record_batch(self, habits, changed, events, points, ledger=()):
+        records = [{'habit': h.name, 'category': h.category} for h in changed if h.name not in self.names]
+        records += [{'habit': name, 'completed': when.isoformat()} for name, when in events]
+        self.names.update(h.name for h in changed)
+        self.points = points
+        self._send("import", records=records)
+
+    def poll(self, handler):
+        # Other clients' changes arrive as deltas instead.
+        handler(None)
+
+    def load_ledger(self):
+        # The server keeps each user's ledger and sends it in the snapshot.
+        return self.snapshot.get('ledger')
+
+    def load_points(self):
+        return self.snapshot['points']
+
+    def save_points(self, points, ledger=()):
+        # Sent as a difference so spends from two clients both count.
+        delta, self.points = points - self.points, points
+        if delta:
+            self._send("adjust_points", delta=delta)
+
+    def load_rewards(self):
+        return self.snapshot['rewards']
+
+    def save_rewards(self, rewards):
+        self._send("rewards", rewards=list(rewards))
+
+    def load_last_update(self):
+        # The server runs the daily reset and sends the result as a delta.
+        return str(datetime.now().date())
+
+    def save_last_update(self, last_update):
+        pass
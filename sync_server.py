@@ -0,0 +1,475 @@
+import argparse
+import asyncio
+import json
+import sqlite3
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime
+
+from core import HabitCore
+from storage import DEFAULT_REWARDS, encode_habit, first_completion, opening_record
+
+# One process serves many users. Each user gets a HabitCore while any of
+# their clients is connected, so points and streak rules are the same as in
+# the app. Clients speak JSON lines:
+#   -> {"op": "hello", "user": "...", "since": version}
+#   <- {"op": "snapshot", ...} or a run of {"op": "delta", ...}
+#   -> {"op": "complete" | "add_habit" | "import" | "adjust_points" | "rewards", "id": "...", ...}
+#   <- {"op": "ack", "id": "...", "ok": true} and a delta to every client of that user
+DEFAULT_PORT = 8765
+FLUSH_INTERVAL = 0.05
+RECENT_DELTAS = 1000
+RECENT_OPS = 10000
+SEND_QUEUE = 1000
+
+
+class ServerStore:
+    # Shared SQLite store for all users. Writes from every session are queued
+    # in memory and committed together every FLUSH_INTERVAL, coalescing
+    # repeated updates to the same habit or state key.
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS habits (
+            user TEXT NOT NULL,
+            name TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            streak INTEGER NOT NULL,
+            total_completions INTEGER NOT NULL,
+            last_completed TEXT,
+            PRIMARY KEY (user, name)
+        );
+        CREATE TABLE IF NOT EXISTS completions (
+            id INTEGER PRIMARY KEY,
+            user TEXT NOT NULL,
+            habit TEXT NOT NULL,
+            at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS completions_user ON completions (user, id);
+        CREATE TABLE IF NOT EXISTS ledger (
+            id INTEGER PRIMARY KEY,
+            user TEXT NOT NULL,
+            record TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS ledger_user ON ledger (user, id);
+        CREATE TABLE IF NOT EXISTS state (
+            user TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            PRIMARY KEY (user, key)
+        );
+    """
+
+    def __init__(self, path="sync.db", flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        # SQLite is only touched from this one thread.
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sync-store")
+        self.conn = None
+        self.habits = {}
+        self.completions = []
+        self.ledger = []
+        self.state = {}
+        self.flush_task = None
+
+    async def open(self):
+        await self._call(self._open)
+        self.flush_task = asyncio.create_task(self._flush_loop())
+        return self
+
+    def _open(self):
+        self.conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+
+    async def close(self):
+        if self.flush_task:
+            self.flush_task.cancel()
+        await self.flush()
+        await self._call(self.conn.close)
+        self.executor.shutdown()
+
+    def _call(self, fn, *args):
+        return asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def put_habit(self, user, position, record):
+        self.habits[(user, record['name'])] = (user, record['name'], position, record['category'], record['streak'],
+                                               record['total_completions'], record['last_completed'])
+
+    def add_completions(self, user, events):
+        self.completions.extend((user, name, when.isoformat()) for name, when in events)
+
+    def add_ledger(self, user, records):
+        # Records as in points_ledger.jsonl, transactions and snapshots alike.
+        self.ledger.extend((user, json.dumps(record)) for record in records)
+
+    def set_state(self, user, key, value):
+        self.state[(user, key)] = (user, key, json.dumps(value))
+
+    @property
+    def pending(self):
+        return bool(self.habits or self.completions or self.ledger or self.state)
+
+    async def flush(self):
+        if not self.pending:
+            return
+        batch = (list(self.habits.values()), self.completions, self.ledger, list(self.state.values()))
+        self.habits, self.completions, self.ledger, self.state = {}, [], [], {}
+        await self._call(self._write, batch)
+
+    def _write(self, batch):
+        habits, completions, ledger, state = batch
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany("""
+                INSERT INTO habits (user, name, position, category, streak, total_completions, last_completed)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(user, name) DO UPDATE SET category = excluded.category, streak = excluded.streak,
+                    total_completions = excluded.total_completions, last_completed = excluded.last_completed
+            """, habits)
+            self.conn.executemany("INSERT INTO completions (user, habit, at) VALUES (?, ?, ?)", completions)
+            self.conn.executemany("INSERT INTO ledger (user, record) VALUES (?, ?)", ledger)
+            self.conn.executemany("INSERT OR REPLACE INTO state (user, key, value) VALUES (?, ?, ?)", state)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except sqlite3.Error as e:
+                print(f"sync store: write failed: {e}", file=sys.stderr)
+
+    async def read_user(self, user):
+        # Queued writes go first so a user who just disconnected reads back
+        # what they wrote.
+        await self.flush()
+        return await self._call(self._read_user, user)
+
+    def _read_user(self, user):
+        habits = [{'name': name, 'category': category, 'streak': streak,
+                   'total_completions': total_completions, 'last_completed': last_completed}
+                  for name, category, streak, total_completions, last_completed in self.conn.execute("""
+                      SELECT name, category, streak, total_completions, last_completed
+                      FROM habits WHERE user = ? ORDER BY position
+                  """, (user,))]
+        completions = [(name, datetime.fromisoformat(at)) for name, at in self.conn.execute(
+            "SELECT habit, at FROM completions WHERE user = ? ORDER BY id", (user,))]
+        ledger = [json.loads(record) for record, in self.conn.execute(
+            "SELECT record FROM ledger WHERE user = ? ORDER BY id", (user,))]
+        state = {key: json.loads(value) for key, value in self.conn.execute(
+            "SELECT key, value FROM state WHERE user = ?", (user,))}
+        return {'habits': habits, 'completions': completions, 'ledger': ledger, 'state': state}
+
+
+class UserStorage:
+    # The storage interface HabitCore expects, backed by rows read once at
+    # session start and writes queued on the shared ServerStore.
+    writer = None
+    archive = None
+
+    def __init__(self, store, user, data):
+        self.store = store
+        self.user = user
+        self.data = data
+        self.positions = {record['name']: i for i, record in enumerate(data['habits'])}
+
+    def close(self):
+        pass
+
+    def loading(self):
+        return nullcontext()
+
+    def _position(self, name):
+        position = self.positions.get(name)
+        if position is None:
+            position = self.positions[name] = len(self.positions)
+        return position
+
+    def load_habits(self):
+        return self.data['habits']
+
+    def save_habits(self, habits, changed=None):
+        for habit in habits if changed is None else changed:
+            self.store.put_habit(self.user, self._position(habit.name), encode_habit(habit))
+
+    def load_completions(self, seed=()):
+        return self.data['completions']
+
+    def append_completions(self, events):
+        self.store.add_completions(self.user, events)
+
+    def record_completion(self, habit, habits, points, ledger=()):
+        self.save_habits(habits, [habit])
+        self.save_points(points, ledger)
+        self.append_completions([(habit.name, habit.last_completed)])
+
+    def record_batch(self, habits, changed, events, points, ledger=()):
+        self.save_habits(habits, changed)
+        self.save_points(points, ledger)
+        self.append_completions(events)
+
+    def _get(self, key, default):
+        return self.data['state'].get(key, default)
+
+    def poll(self, handler):
+        # The session's core is the only writer for its user.
+        handler(None)
+
+    def load_ledger(self):
+        # A user from before the ledger was kept has only a balance, which
+        # is booked as an opening transaction once.
+        records = self.data['ledger']
+        points = self._get('points', 0)
+        if not records and points:
+            records = [opening_record(points, first_completion(self.data['completions']))]
+            self.store.add_ledger(self.user, records)
+        return records
+
+    def load_points(self):
+        return self._get('points', 0)
+
+    def save_points(self, points, ledger=()):
+        self.store.add_ledger(self.user, ledger)
+        self.store.set_state(self.user, 'points', points)
+
+    def load_rewards(self):
+        return self._get('rewards', DEFAULT_REWARDS)
+
+    def save_rewards(self, rewards):
+        self.store.set_state(self.user, 'rewards', list(rewards))
+
+    def load_last_update(self):
+        return self._get('last_update', str(datetime.now().date()))
+
+    def save_last_update(self, last_update):
+        self.store.set_state(self.user, 'last_update', last_update)
+
+    def load_version(self):
+        return self._get('sync_version', 0)
+
+    def save_version(self, version):
+        self.store.set_state(self.user, 'sync_version', version)
+
+
+class Connection:
+    # Outgoing messages go through a bounded queue drained by one task, so a
+    # slow client never blocks a broadcast. A client that falls too far
+    # behind is dropped and catches up with `since` when it reconnects.
+    def __init__(self, writer):
+        self.writer = writer
+        self.queue = asyncio.Queue(SEND_QUEUE)
+        self.sender = asyncio.create_task(self._send_loop())
+
+    def send(self, message):
+        try:
+            self.queue.put_nowait(json.dumps(message).encode() + b"\n")
+        except asyncio.QueueFull:
+            self.writer.close()
+
+    async def _send_loop(self):
+        try:
+            while True:
+                data = await self.queue.get()
+                self.writer.write(data)
+                if self.queue.empty():
+                    await self.writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+
+    async def close(self):
+        self.sender.cancel()
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+class Session:
+    def __init__(self, user, storage):
+        self.user = user
+        self.core = HabitCore(storage)
+        self.version = storage.load_version()
+        self.connections = set()
+        self.deltas = deque(maxlen=RECENT_DELTAS)
+        # Op ids already applied, so a client resending after a dropped
+        # connection does not complete a habit twice.
+        self.seen_ops = set()
+        self.seen_order = deque()
+
+    def snapshot(self):
+        core = self.core
+        completions = [[name, when.isoformat()] for name, whens in core.completion_log.by_habit.items() for when in whens]
+        return {'op': "snapshot", 'version': self.version, 'habits': [encode_habit(h) for h in core.habits],
+                'completions': completions, 'points': core.points, 'rewards': core.rewards,
+                'ledger': core.ledger.records()}
+
+    def deltas_since(self, version):
+        # None when the client is too far behind and needs a snapshot.
+        if version == self.version:
+            return []
+        if not self.deltas or version < self.deltas[0]['version'] - 1 or version > self.version:
+            return None
+        return [delta for delta in self.deltas if delta['version'] > version]
+
+    def remember(self, op_id):
+        self.seen_ops.add(op_id)
+        self.seen_order.append(op_id)
+        if len(self.seen_order) > RECENT_OPS:
+            self.seen_ops.discard(self.seen_order.popleft())
+
+    def publish(self, op_id, habits=(), completions=(), rewards=None):
+        self.version += 1
+        self.core.storage.save_version(self.version)
+        delta = {'op': "delta", 'version': self.version, 'op_id': op_id,
+                 'habits': [encode_habit(h) for h in habits],
+                 'completions': [[name, when.isoformat()] for name, when in completions],
+                 'points': self.core.points}
+        if rewards is not None:
+            delta['rewards'] = rewards
+        self.deltas.append(delta)
+        for connection in self.connections:
+            connection.send(delta)
+
+    def apply(self, message):
+        op = message.get('op')
+        op_id = message.get('id')
+        core = self.core
+        if op == "complete":
+            habit = core.find(message.get('habit'))
+            if habit is None:
+                raise ValueError(f"unknown habit {message.get('habit')!r}")
+            at = message.get('at')
+            core.complete_habit(habit, datetime.fromisoformat(at) if at else None)
+            self.publish(op_id, [habit], [(habit.name, habit.last_completed)])
+        elif op == "add_habit":
+            habit = core.add_habit(message.get('name'), message.get('category') or "General")
+            if habit:
+                self.publish(op_id, [habit])
+        elif op == "import":
+            result = core.import_records(message.get('records', []))
+            self.publish(op_id, result.habits_to_save, result.events)
+        elif op == "adjust_points":
+            core.adjust_points(int(message['delta']), "adjust")
+            self.publish(op_id)
+        elif op == "rewards":
+            core.rewards = list(message['rewards'])
+            core.save_rewards()
+            self.publish(op_id, rewards=core.rewards)
+        else:
+            raise ValueError(f"unknown op {op!r}")
+
+    def rollover(self):
+        reset = self.core.check_daily_reset()
+        if reset:
+            self.publish(None, reset)
+
+
+class SyncServer:
+    def __init__(self, store):
+        self.store = store
+        self.sessions = {}
+        self.loading = {}
+        self.server = None
+
+    async def start(self, host="127.0.0.1", port=DEFAULT_PORT):
+        # port=0 picks a free port; see self.port.
+        self.server = await asyncio.start_server(self.handle, host, port, limit=2 ** 24)
+        return self
+
+    @property
+    def port(self):
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        await self.store.close()
+
+    async def open_session(self, user):
+        # Sessions are only looked up and joined between awaits, so a
+        # session that was just evicted is never handed out.
+        while True:
+            session = self.sessions.get(user)
+            if session:
+                return session
+            task = self.loading.get(user)
+            if task is None:
+                task = self.loading[user] = asyncio.create_task(self._load(user))
+            await task
+
+    async def _load(self, user):
+        try:
+            data = await self.store.read_user(user)
+            self.sessions[user] = Session(user, UserStorage(self.store, user, data))
+        finally:
+            del self.loading[user]
+
+    async def handle(self, reader, writer):
+        connection = Connection(writer)
+        session = None
+        try:
+            hello = json.loads(await reader.readline() or "null")
+            if not isinstance(hello, dict) or hello.get('op') != "hello" or not hello.get('user'):
+                connection.send({'op': "error", 'error': "expected hello"})
+                return
+            session = await self.open_session(str(hello['user']))
+            session.rollover()
+            session.connections.add(connection)
+            since = int(hello.get('since') or 0)
+            deltas = session.deltas_since(since) if since else None
+            if deltas is None:
+                connection.send(session.snapshot())
+            else:
+                for delta in deltas:
+                    connection.send(delta)
+                connection.send({'op': "current", 'version': session.version})
+            while line := await reader.readline():
+                message = json.loads(line)
+                op_id = message.get('id')
+                if op_id is None or op_id not in session.seen_ops:
+                    session.rollover()
+                    try:
+                        session.apply(message)
+                    except (KeyError, TypeError, ValueError) as e:
+                        connection.send({'op': "ack", 'id': op_id, 'ok': False, 'error': str(e)})
+                        continue
+                    if op_id is not None:
+                        session.remember(op_id)
+                connection.send({'op': "ack", 'id': op_id, 'ok': True})
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            if session:
+                session.connections.discard(connection)
+                if not session.connections and self.sessions.get(session.user) is session:
+                    del self.sessions[session.user]
+            await connection.close()
+
+
+async def serve(host="127.0.0.1", port=DEFAULT_PORT, path="sync.db"):
+    store = await ServerStore(path).open()
+    return await SyncServer(store).start(host, port)
+
+
+async def run_forever(host, port, path):
+    server = await serve(host, port, path)
+    print(f"Habit Hero sync server on {host}:{server.port} ({path})", file=sys.stderr)
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Habit Hero sync server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--db", default="sync.db")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run_forever(args.host, args.port, args.db))
+    except KeyboardInterrupt:
+        pass